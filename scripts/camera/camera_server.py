@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+import time
+import timeit
+import rospy
+import depthai as dai
+
+try:
+    from frame_ring import FrameRing, RING_NAME, RING_SLOTS
+except ImportError:
+    from camera.frame_ring import FrameRing, RING_NAME, RING_SLOTS
+
+# Frames dropped at start up while the camera comes in to focus
+WARMUP_FRAMES = 20
+
+
+class CameraServer:
+    # Owns the OAK device and writes every preview frame with its capture time into a FrameRing.
+    # The detector, controller, data baggers and previews attach to the ring by name instead of opening the
+    # device themselves, only one process can have it.
+    def __init__(self):
+        rospy.init_node("camera_server")
+        self.name = rospy.get_param("~ring", RING_NAME)
+        self.width = rospy.get_param("~width", 300)
+        self.height = rospy.get_param("~height", 300)
+        self.fps = rospy.get_param("~fps", 60)
+        self.slots = rospy.get_param("~slots", RING_SLOTS)
+        self.focus = rospy.get_param("~focus", None)  # lens position for manual focus, autofocus if not set
+
+    def create_pipeline(self):
+        pipeline = dai.Pipeline()
+
+        # Define source and output
+        camRgb = pipeline.create(dai.node.ColorCamera)
+        xoutRgb = pipeline.create(dai.node.XLinkOut)
+        controlIn = pipeline.create(dai.node.XLinkIn)
+
+        controlIn.setStreamName("control")
+        controlIn.out.link(camRgb.inputControl)
+
+        xoutRgb.setStreamName("rgb")
+
+        # Properties, interleaved BGR so frames go in to the ring without a planar to interleaved conversion
+        camRgb.setPreviewSize(self.width, self.height)
+        camRgb.setInterleaved(True)
+        camRgb.setColorOrder(dai.ColorCameraProperties.ColorOrder.BGR)
+        camRgb.setFps(self.fps)
+
+        camRgb.preview.link(xoutRgb.input)
+        return pipeline
+
+    def run(self):
+        with dai.Device(self.create_pipeline()) as device:
+            print("Connected cameras: ", device.getConnectedCameras())
+            print("Usb speed: ", device.getUsbSpeed().name)
+
+            if self.focus is not None:
+                ctrl = dai.CameraControl()
+                ctrl.setManualFocus(self.focus)
+                device.getInputQueue("control").send(ctrl)
+
+            qRgb = device.getOutputQueue(name="rgb", maxSize=1, blocking=False)
+
+            # bring camera in to focus
+            for _ in range(WARMUP_FRAMES):
+                qRgb.get()
+
+            with FrameRing(self.name, (self.height, self.width, 3), self.slots) as ring:
+                rospy.loginfo("Camera server writing %dx%d at %d fps to %s" % (self.width, self.height, self.fps, self.name))
+                while not rospy.is_shutdown():
+                    frame = qRgb.get()
+                    # Device capture time moved on to this host's clocks, the frame stamp is on the host steady
+                    # clock that dai.Clock reads
+                    age = (dai.Clock.now() - frame.getTimestamp()).total_seconds()
+                    ring.write(frame.getCvFrame(), timeit.default_timer() - age, time.time() - age)
+
+
+if __name__ == "__main__":
+    CameraServer().run()
@@ -0,0 +1,148 @@
+import threading
+import time
+from collections import deque
+
+# Frames further apart than this are not paired, s. Half a frame period at 60 fps.
+SYNC_TOLERANCE = 0.008
+# Frames kept per sensor while waiting to be paired
+QUEUE_LENGTH = 30
+
+
+class SensorReader:
+    # Reads one sensor in its own thread, so a slow sensor doesn't hold up the others.
+    # read() blocks until the next frame and returns (stamp, frame), stamp the capture time in wall clock s.
+    # Use stamp_on_arrival for sensors that don't have a capture time.
+    def __init__(self, name, read, sync):
+        self.name = name
+        self.read = read
+        self.sync = sync
+        self.frames = deque()
+        self.received = 0
+        self.overflow = 0  # dropped because the queue was full
+        self.unmatched = 0  # dropped because nothing else was close enough in time
+        self.offset = 0.0  # sum of stamp minus reference stamp over the matched sets
+
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+
+    def run(self):
+        while True:
+            stamped = self.read()
+            with self.sync.condition:
+                if len(self.frames) == QUEUE_LENGTH:
+                    self.frames.popleft()
+                    self.overflow += 1
+                self.frames.append(stamped)
+                self.received += 1
+                self.sync.condition.notify()
+
+
+def stamp_on_arrival(get_frame, latency=0.0):
+    # read() for a SensorReader from a blocking get_frame(), stamped when the frame is returned less latency, the
+    # sensor's capture to delivery delay (s). Without it the stamps are late by that delay compared to sensors that
+    # stamp capture, and frames get paired with the other sensors' frames from a later capture.
+    def read():
+        frame = get_frame()
+        return time.time() - latency, frame
+    return read
+
+
+class FrameSynchronizer:
+    # Pairs frames from several sensors, each read in its own SensorReader thread.
+    # The first sensor is the reference: each of its frames is matched with the nearest frame in time from every
+    # other sensor once that sensor has a frame at or after it. Sets with a frame further than tolerance from the
+    # reference are dropped and counted as unmatched, as are the other sensors' frames that no reference frame took.
+    def __init__(self, tolerance=SYNC_TOLERANCE):
+        self.tolerance = tolerance
+        self.condition = threading.Condition()
+        self.readers = []
+        self.matched = 0
+
+    def add(self, name, read):
+        reader = SensorReader(name, read, self)
+        self.readers.append(reader)
+        return reader
+
+    def clear(self):
+        # Forget everything received so far, e.g. at the start of a recording
+        with self.condition:
+            for reader in self.readers:
+                reader.frames.clear()
+                reader.received = reader.overflow = reader.unmatched = 0
+                reader.offset = 0.0
+            self.matched = 0
+
+    def next(self, timeout=None):
+        # [(stamp, frame)] per sensor in the order they were added, None on timeout
+        deadline = None if timeout is None else time.time() + timeout
+        reference, others = self.readers[0], self.readers[1:]
+        with self.condition:
+            while True:
+                matched = self.match(reference, others)
+                if matched is not None:
+                    return matched
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+
+    def match(self, reference, others):
+        while reference.frames:
+            stamp = reference.frames[0][0]
+            # Nearest is only known once every other sensor has something at or after the reference frame
+            if not all(reader.frames and reader.frames[-1][0] >= stamp for reader in others):
+                return None
+
+            nearest = []
+            for reader in others:
+                frames = reader.frames
+                while len(frames) > 1 and abs(frames[1][0] - stamp) <= abs(frames[0][0] - stamp):
+                    frames.popleft()
+                    reader.unmatched += 1
+                nearest.append(frames[0])
+
+            if all(abs(other_stamp - stamp) <= self.tolerance for other_stamp, _ in nearest):
+                for reader, (other_stamp, _) in zip(others, nearest):
+                    reader.frames.popleft()
+                    reader.offset += other_stamp - stamp
+                self.matched += 1
+                return [reference.frames.popleft()] + nearest
+            reference.frames.popleft()
+            reference.unmatched += 1
+        return None
+
+    def summary(self):
+        # Mean offset is each sensor's stamp minus the reference stamp over the matched sets. Close to half a frame
+        # period in either direction means the sensors are stamped on different bases (latency not taken off).
+        return "synchronised sets: %d, " % self.matched + ", ".join(
+            "%s received %d unmatched %d overflow %d%s" % (
+                r.name, r.received, r.unmatched, r.overflow,
+                " mean offset %+.1f ms" % (r.offset / self.matched * 1e3) if r is not self.readers[0] and self.matched else "")
+            for r in self.readers)
+
+
+def ring_reader(ring):
+    # read() for a SensorReader over a FrameRing: every frame in order with its capture time, copied out of the ring
+    # since it may wait in the queue for longer than the ring keeps it
+    last = ring.count()
+
+    def read():
+        nonlocal last
+        while True:
+            last, _, wall_time, view = ring.next(last, newest=False)
+            frame = view.copy()
+            # A reader that fell behind can have its slot overwritten during the copy, that frame is dropped
+            if ring.valid(last):
+                return wall_time, frame
+            ring.dropped += 1
+    return read
+
+
+def encoded(read, encode):
+    # read() that hands on encode(frame, stamp) instead of the frame, so frames are encoded in the sensor's own
+    # reader thread rather than one after another in the loop taking the sets
+    def read_encoded():
+        stamp, frame = read()
+        return stamp, encode(frame, stamp)
+    return read_encoded
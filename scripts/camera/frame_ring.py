@@ -0,0 +1,131 @@
+import time
+import timeit
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+# Shared memory name of the OAK preview ring written by camera_server.py
+RING_NAME = "oak_rgb"
+RING_SLOTS = 8
+# Sleep between checks while waiting for a frame, s
+POLL = 0.0005
+
+# Header: frames written, height, width, channels, slots. Per slot: frame number, capture time, capture wall time.
+HEADER_SIZE = 5
+SLOT_META = 3
+ALIGN = 64
+
+
+class FrameRing:
+    # Ring of the newest camera frames in named shared memory, one writer (the camera server) and any number of
+    # reader processes that attach by name.
+    # Frame k (counting from 1) lives in slot (k - 1) % slots with its capture time on the timeit clock (comparable
+    # between processes) and on the wall clock (for ROS stamps).
+    # Readers get read only views straight into the shared memory, no copy. A view stays valid for about slots - 1
+    # frame periods, valid(k) says whether frame k is still intact, check it after use when that matters.
+    # With shape, the ring is created (writer side), without it an existing ring is attached.
+    def __init__(self, name=RING_NAME, shape=None, slots=RING_SLOTS, wait=True):
+        self.name = name
+        self.owner = shape is not None
+        if self.owner:
+            height, width, channels = shape
+            size = self.layout(height, width, channels, slots)
+            try:
+                # Left over from a server that didn't shut down cleanly
+                stale = shared_memory.SharedMemory(name)
+                stale.close()
+                stale.unlink()
+            except FileNotFoundError:
+                pass
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+            self.header = np.ndarray(HEADER_SIZE, np.float64, self.shm.buf)
+            self.header[:] = (0, height, width, channels, slots)
+        else:
+            self.shm = self.attach(name, wait)
+            self.header = np.ndarray(HEADER_SIZE, np.float64, self.shm.buf)
+            height, width, channels, slots = self.header[1:].astype(int)
+            self.layout(height, width, channels, slots)
+
+        self.shape = (height, width, channels)
+        self.slots = slots
+        self.meta = np.ndarray((slots, SLOT_META), np.float64, self.shm.buf, self.meta_offset)
+        self.frames = np.ndarray((slots,) + self.shape, np.uint8, self.shm.buf, self.frames_offset)
+        if not self.owner:
+            self.frames.flags.writeable = False
+        self.dropped = 0  # reader side, frames missed between next() calls
+
+    def layout(self, height, width, channels, slots):
+        self.meta_offset = HEADER_SIZE * 8
+        self.frames_offset = -(-(self.meta_offset + slots * SLOT_META * 8) // ALIGN) * ALIGN
+        return self.frames_offset + slots * height * width * channels
+
+    @staticmethod
+    def attach(name, wait):
+        while True:
+            try:
+                shm = shared_memory.SharedMemory(name)
+                break
+            except FileNotFoundError:
+                if not wait:
+                    raise
+                print("Waiting for camera server!")
+                time.sleep(1)
+        # Attaching registers the memory with this process's resource tracker, which would unlink it from under the
+        # server when this process exits
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+    def write(self, image, capture_time, wall_time):
+        frame = int(self.header[0]) + 1
+        slot = (frame - 1) % self.slots
+        self.meta[slot, 0] = -frame  # being written
+        self.frames[slot] = image
+        self.meta[slot, 1:] = capture_time, wall_time
+        self.meta[slot, 0] = frame
+        self.header[0] = frame
+
+    def count(self):
+        return int(self.header[0])
+
+    def read(self, frame):
+        # (frame, capture time, wall time, view) of frame, None when it has been overwritten or isn't written yet
+        meta = self.meta[(frame - 1) % self.slots]
+        if frame < 1 or meta[0] != frame:
+            return None
+        capture_time, wall_time = meta[1], meta[2]
+        if meta[0] != frame:
+            return None
+        return frame, capture_time, wall_time, self.frames[(frame - 1) % self.slots]
+
+    def valid(self, frame):
+        return self.meta[(frame - 1) % self.slots, 0] == frame
+
+    def next(self, after=0, newest=True, timeout=None):
+        # First frame after frame number after, waiting for it. newest skips to the newest frame written,
+        # otherwise frames are returned in order while they are still in the ring.
+        # Returns (frame, capture time, wall time, view), None on timeout.
+        deadline = None if timeout is None else timeit.default_timer() + timeout
+        while True:
+            count = self.count()
+            if count > after:
+                # In order readers that fell behind carry on from the oldest frame that is safe to read
+                frame = count if newest else max(after + 1, count - self.slots + 2)
+                result = self.read(frame)
+                if result is not None:
+                    if after:
+                        self.dropped += frame - after - 1
+                    return result
+            elif deadline is not None and timeit.default_timer() > deadline:
+                return None
+            time.sleep(POLL)
+
+    def close(self):
+        self.header = self.meta = self.frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
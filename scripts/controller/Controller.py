@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 import numpy as np
 import cv2
-from multiprocessing import Process, Queue
+from multiprocessing import Process
 
 import rospy, sys
 from time import sleep
@@ -10,7 +10,6 @@ from std_msgs.msg import Empty as EmptyMsg
 from cv_bridge import CvBridge, CvBridgeError
 from std_srvs.srv import Empty, EmptyResponse
 from grasp_executor.srv import AngleTrack
-import depthai as dai
 from robotiq_2f_gripper_control.msg import (
     _Robotiq2FGripper_robot_output as outputMsg,
     _Robotiq2FGripper_robot_input as inputMsg,
@@ -18,98 +17,132 @@ from robotiq_2f_gripper_control.msg import (
 import timeit
 
 from rotation_measurement.data_processing.blob_detector import AngleDetector
+from controller.seqlock import SeqlockSlot
+from camera.frame_ring import FrameRing
+from controller.rate_scheduler import DeadlineScheduler
+from controller.gripper_commander import GripperCommander, MAX_RATE
+from controller.slip_controller import SlipController, ACTUATION_DELAY
 
+# Control loop rate, Hz
+CONTROL_RATE = 200
 
-class AdaptiveController:
+
+class AdaptiveController(SlipController):
+    # SlipController on the robot: camera process, control process and the gripper topics
     def __init__(self):
         rospy.init_node("Controller")
 
-        self.AD = AngleDetector(writeImages=False, showImages=False, cv2Image=True)
-        self.goal = 60
+        # Angle feedback from the camera (blob detector) or from the papillarray sensors (streaming LSTM),
+        # both give getAngle/getAngularVelocity
+        self.feedback = rospy.get_param("~feedback", "camera")
+        if self.feedback == "tactile":
+            # Only needed in this mode, torch is not on every machine that runs the camera controller
+            from rotation_measurement.model_papilarray.streaming_lstm import StreamingAngleEstimator
+
+            self.AD = StreamingAngleEstimator(rospy.get_param("~model_path"), start_angle=rospy.get_param("~start_angle", 0.0))
+        else:
+            self.AD = AngleDetector(writeImages=False, showImages=False, cv2Image=True, recordVideo=False, useROI=True, useLUT=True, useKalman=True)
         # self.initialiseCamera()
 
-        self.gripper_sub = rospy.Subscriber(
-            "/Robotiq2FGripperRobotInput",
-            inputMsg.Robotiq2FGripper_robot_input,
-            self.gripper_state_callback,
-        )
         self.gripper_pub = rospy.Publisher(
             "/Robotiq2FGripperRobotOutput",
             outputMsg.Robotiq2FGripper_robot_output,
             queue_size=1,
         )
-
-        self.prev_data = None
+        # The control process hands its commands to a publisher thread in this process
+        self.gripper = GripperCommander(self.gripper_pub, rospy.get_param("~gripper_rate", MAX_RATE))
+        self.gripper_sub = rospy.Subscriber(
+            "/Robotiq2FGripperRobotInput",
+            inputMsg.Robotiq2FGripper_robot_input,
+            self.gripper_state_callback,
+        )
 
         self.angle = self.AD.getAngle
         self.angularVelocity = self.AD.getAngularVelocity
         self.gripper_data = None
-        self.last_move_time = 0
 
-        self.PUBLISH = True
+        # Paces control(), its jitter/overrun stats are printed when the loop finishes
+        self.scheduler = DeadlineScheduler(rospy.get_param("~control_rate", CONTROL_RATE))
 
         while not (self.gripper_data or rospy.is_shutdown()):
             rospy.sleep(1)
             rospy.loginfo("Waiting for gripper!")
 
-        self.q = Queue()
-
-        self.p1 = Process(target=self.getCameraFrame)
+        # Camera process (or the tactile callbacks) overwrites the newest (capture time, angle, angular velocity),
+        # the control loop always reads the newest
+        super().__init__(SeqlockSlot(3), self.gripper, goal=60,
+                         actuation_delay=rospy.get_param("~actuation_delay", ACTUATION_DELAY))
+
+        if self.feedback == "tactile":
+            # Estimates at the sensor rate from the subscriber threads of this process, no camera process
+            from papillarray_ros_v2.msg import SensorState
+
+            self.tactile_data_0 = None
+            self.tactile_0_sub = rospy.Subscriber("/hub_0/sensor_0", SensorState, self.sensor_0_callback)
+            self.tactile_1_sub = rospy.Subscriber("/hub_0/sensor_1", SensorState, self.sensor_1_callback)
+        else:
+            self.p1 = Process(target=self.getCameraFrame)
+            self.p1.start()
         self.p2 = Process(target=self.control)
 
-        self.p1.start()
         self.p2.start()
+        self.gripper.start()
 
         # wait for p2 to finish
         self.p2.join()
+        print(self.gripper.summary())
         # kill the camera
         # self.p1.kill()
 
+        if self.feedback == "tactile":
+            return
+
+        # Keep tracking, the camera server takes any number of readers
+        ring = FrameRing()
+        frame_no = 0
         while not rospy.is_shutdown():
-            image = self.qRgb.get().getCvFrame()
-            self.AD.update_angle(image)
+            frame_no, captured, _, image = ring.next(frame_no)
+            self.AD.update_angle(image, captured)
             # print(round(self.angularVelocity(), 2), round(self.angle(), 2))
 
     # def initialiseCamera(self):
 
     def getCameraFrame(self):
-        pipeline = dai.Pipeline()
-
-        # Define source and output
-        camRgb = pipeline.create(dai.node.ColorCamera)
-        xoutRgb = pipeline.create(dai.node.XLinkOut)
-
-        xoutRgb.setStreamName("rgb")
-
-        # Properties
-        camRgb.setPreviewSize(300, 300)
-        camRgb.setInterleaved(False)
-        camRgb.setColorOrder(dai.ColorCameraProperties.ColorOrder.RGB)
-        camRgb.setFps(60)
-
-        camRgb.preview.link(xoutRgb.input)
-
-        device = dai.Device(pipeline)
-        qRgb = device.getOutputQueue(name="rgb", maxSize=1, blocking=False)
-
-        # bring camera in to focus
-        for _ in range(20):
-            img = qRgb.get().getCvFrame()
+        # Frames come from the camera server (camera/camera_server.py), which owns the OAK device and stamps
+        # each frame with its capture time
+        ring = FrameRing()
+        frame_no = 0
 
         # initialise things
         for _ in range(10):
-            self.AD.update_angle(qRgb.get().getCvFrame())
+            frame_no, captured, _, image = ring.next(frame_no)
+            self.AD.update_angle(image, captured)
 
         while not rospy.is_shutdown():
-            image = qRgb.get().getCvFrame()
-            self.AD.update_angle(image)
-            self.q.put((timeit.default_timer(), self.angle(), self.angularVelocity()))
+            frame_no, captured, _, image = ring.next(frame_no)
+            # Angle and velocity are for the capture time, not for when detection finished
+            self.AD.update_angle(image, captured)
+            self.latest.write((captured, self.angle(), self.angularVelocity()))
+
+    def sensor_0_callback(self, sensor_state_msg):
+        self.tactile_data_0 = sensor_state_msg
+
+    def sensor_1_callback(self, sensor_state_msg):
+        # The hub publishes both sensors each cycle, a sensor_1 message with the newest sensor_0 is one time step.
+        # Stamped on arrival on the control clock, like the bagger stamps its time topic.
+        if self.tactile_data_0 is None:
+            return
+        stamp = timeit.default_timer()
+        self.AD.update(self.tactile_data_0, sensor_state_msg, stamp)
+        self.latest.write((stamp, self.angle(), self.angularVelocity()))
 
     def control(self):
         arrived = False
         t1 = timeit.default_timer()
+        self.scheduler.reset()
 
         while not arrived and not rospy.is_shutdown():
+            self.scheduler.wait()
             arrived = self.control_loop()
 
             t2 = timeit.default_timer()
@@ -121,67 +154,13 @@ class AdaptiveController:
             t1 = timeit.default_timer()
 
         print("hello")
-
-    def control_loop(self):
-
-        # camera is not initalised
-        if self.prev_data is None and self.q.empty():
-            return False
-
-        self.prev_data = self.prev_data if self.q.empty() else self.q.get()
-
-        (prev_time, angle, angleVel) = self.prev_data
-
-        time_since_update = max(0, prev_time - self.prev_data[0])
-        time_delay = 0
-
-        # future predict the angle of the object, offset by time delay
-        object_angle = angle + angleVel * (time_delay + time_since_update)
-
-        current_time = timeit.default_timer()
-
-        if abs(self.goal - object_angle) < 1 or angle > self.goal:
-            print(self.goal, angle, object_angle, "sent stopped!!")
-            self.close_gripper()
-            return True
-
-        canMove = (current_time - self.last_move_time) > 0.05
-
-        # if the object is slow, and the gripper has opened
-        if angleVel < 0.3 and canMove:
-            print("loooooosen")
-            self.slightly_open_gripper()
-
-        return False
-
-    def slightly_open_gripper(self):
-        command = outputMsg.Robotiq2FGripper_robot_output()
-        command.rPR = self.gripper_width - 1
-        command.rACT = 1
-        command.rGTO = 1
-        command.rSP = 255
-        command.rFR = 150
-
-        self.last_move = timeit.default_timer()
-
-        if self.PUBLISH:
-            print(command)
-            self.gripper_pub.publish(command)
+        print("control loop: " + self.scheduler.summary())
+        self.print_sample_stats()
 
     def gripper_state_callback(self, data):
         self.gripper_data = data
         self.gripper_width = data.gPO
-
-    def close_gripper(self, width=255):
-        command = outputMsg.Robotiq2FGripper_robot_output()
-        command.rPR = width
-        command.rACT = 1
-        command.rGTO = 1
-        command.rSP = 255
-        command.rFR = 150
-
-        if self.PUBLISH:
-            self.gripper_pub.publish(command)
+        self.gripper.update_state(data)
 
 
 if __name__ == "__main__":
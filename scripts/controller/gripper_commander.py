@@ -0,0 +1,110 @@
+import threading
+import timeit
+from multiprocessing import Event
+
+from robotiq_2f_gripper_control.msg import _Robotiq2FGripper_robot_output as outputMsg
+
+from controller.seqlock import SeqlockSlot
+
+# Commands per second sent on to the gripper. The Robotiq RTU driver node forwards a command about every 0.1 s,
+# anything faster only overwrites the previous one inside the node.
+MAX_RATE = 10
+
+
+class GripperCommander:
+    # Gripper command channel between the control process and the ROS process.
+    # The control process calls command(), which only overwrites the newest request in shared memory and never blocks.
+    # A thread in the ROS process publishes the newest request, requests that come in faster than max_rate are
+    # coalesced into the newest one and repeats of the last published command are dropped.
+    # immediate requests (stopping) skip the rate limit.
+    # The commanded position and the reported gPO are both readable from either process.
+    # Create before forking, start() in the process that owns the publisher.
+    def __init__(self, publisher, max_rate=MAX_RATE):
+        self.publisher = publisher
+        self.period = 1.0 / max_rate
+
+        self.requests = SeqlockSlot(4)  # position, speed, force, immediate
+        self.pending = Event()
+        self.published = SeqlockSlot(3)  # position, speed, force of the last published command
+        self.reported = SeqlockSlot(1)  # gPO
+
+        # Publisher thread side
+        self.last_request = 0
+        self.last_publish = -self.period
+        self.last_command = None
+        self.num_published = 0
+        self.coalesced = 0
+        self.repeats = 0
+
+    def start(self):
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+
+    def command(self, position, speed=255, force=150, immediate=False):
+        self.requests.write((position, speed, force, immediate))
+        self.pending.set()
+
+    def update_state(self, data):
+        # From the gripper state callback
+        self.reported.write((data.gPO,))
+
+    def reported_position(self):
+        # None until the gripper has reported
+        sample, _, values = self.reported.read()
+        return int(values[0]) if sample else None
+
+    def commanded_position(self):
+        # None until the first command went out
+        sample, _, values = self.published.read()
+        return int(values[0]) if sample else None
+
+    def tracking_error(self):
+        # Commanded minus reported position, how far the fingers still have to go
+        commanded = self.commanded_position()
+        reported = self.reported_position()
+        if commanded is None or reported is None:
+            return None
+        return commanded - reported
+
+    def run(self):
+        while True:
+            if not self.pending.wait(0.1):
+                continue
+            # Cleared before reading, a request written after this wakes the next wait
+            self.pending.clear()
+            sample, _, (position, speed, force, immediate) = self.requests.read()
+            if sample == self.last_request:
+                continue
+
+            wait = self.last_publish + self.period - timeit.default_timer()
+            if wait > 0 and not immediate:
+                # Too soon after the last command, a newer request arriving meanwhile replaces this one
+                if not self.pending.wait(wait):
+                    self.publish(sample, position, speed, force)
+                continue
+            self.publish(sample, position, speed, force)
+
+    def publish(self, sample, position, speed, force):
+        self.coalesced += sample - self.last_request - 1
+        self.last_request = sample
+
+        command = (int(position), int(speed), int(force))
+        if command == self.last_command:
+            self.repeats += 1
+            return
+
+        msg = outputMsg.Robotiq2FGripper_robot_output()
+        msg.rACT = 1
+        msg.rGTO = 1
+        msg.rPR, msg.rSP, msg.rFR = command
+        self.publisher.publish(msg)
+
+        self.last_publish = timeit.default_timer()
+        self.last_command = command
+        self.published.write(command)
+        self.num_published += 1
+
+    def summary(self):
+        return "gripper commands published: %d, coalesced: %d, repeats dropped: %d, commanded %s reported %s" % (
+            self.num_published, self.coalesced, self.repeats, self.commanded_position(), self.reported_position())
@@ -0,0 +1,74 @@
+import time
+import timeit
+import numpy as np
+
+
+class DeadlineScheduler:
+    # Runs a loop at a fixed rate on absolute deadlines start + k * period, so lateness never accumulates.
+    # wait() sleeps until the next deadline (coarse sleep, then a short spin for the last spin seconds).
+    # When the loop body overruns, the missed deadlines are skipped and the loop stays on the original grid.
+    # Wake up jitter and loop body time of the last history ticks are kept for stats().
+    def __init__(self, rate, spin=0.0002, history=4096):
+        self.period = 1.0 / rate
+        self.spin = spin
+        self.history = history
+
+        self.jitter = np.zeros(history)  # wake up time - deadline
+        self.busy = np.zeros(history)  # time from wake up to the next wait()
+        self.reset()
+
+    def reset(self):
+        self.deadline = None
+        self.last_wake = None
+        self.ticks = 0
+        self.overruns = 0
+        self.missed = 0
+
+    def wait(self):
+        now = timeit.default_timer()
+        if self.deadline is None:
+            self.deadline = now
+        else:
+            self.busy[(self.ticks - 1) % self.history] = now - self.last_wake
+            self.deadline += self.period
+            if now > self.deadline:
+                # Loop body took longer than a period, carry on at the next deadline still ahead
+                late = int((now - self.deadline) / self.period) + 1
+                self.overruns += 1
+                self.missed += late
+                self.deadline += late * self.period
+
+        remaining = self.deadline - timeit.default_timer()
+        if remaining > self.spin:
+            time.sleep(remaining - self.spin)
+        while timeit.default_timer() < self.deadline:
+            pass
+
+        self.last_wake = timeit.default_timer()
+        self.jitter[self.ticks % self.history] = self.last_wake - self.deadline
+        self.ticks += 1
+
+    def stats(self):
+        # Jitter and loop body time in ms over the kept history, overrun counts over the whole run
+        count = min(self.ticks, self.history)
+        jitter = self.jitter[:count] * 1e3
+        busy = self.busy[: min(max(self.ticks - 1, 0), self.history)] * 1e3
+        return {
+            "rate": 1.0 / self.period,
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "missed": self.missed,
+            "jitter_mean": jitter.mean() if count else 0.0,
+            "jitter_p99": np.percentile(jitter, 99) if count else 0.0,
+            "jitter_max": jitter.max() if count else 0.0,
+            "busy_mean": busy.mean() if len(busy) else 0.0,
+            "busy_max": busy.max() if len(busy) else 0.0,
+            "utilisation": busy.mean() / (self.period * 1e3) if len(busy) else 0.0,
+        }
+
+    def summary(self):
+        stats = self.stats()
+        stats["utilisation"] *= 100
+        return ("%(rate).0f Hz, %(ticks)d ticks, %(overruns)d overruns (%(missed)d deadlines missed), "
+                "jitter ms mean %(jitter_mean).3f p99 %(jitter_p99).3f max %(jitter_max).3f, "
+                "loop ms mean %(busy_mean).3f max %(busy_max).3f (%(utilisation).0f%% of period)") % stats
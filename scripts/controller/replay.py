@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+import argparse, glob, os, re, sys
+import time
+import timeit
+import numpy as np
+import cv2
+
+from controller.slip_controller import SlipController, ACTUATION_DELAY
+from rotation_measurement.data_processing.angle_filter import AngleKalman, wrap_angle
+
+# Offline replay of SlipController.control_loop on a simulated clock.
+# Angles come from recorded trials (open loop: angle CSVs from papilarray_bags_to_csv.py or folders of camera frames)
+# or from SlipPlant, a gripper holding an object that slips when the gripper opens (closed loop).
+# Run from scripts/: python -m controller.replay [csvs and frame folders] [--plant N]
+
+CONTROL_RATE = 200  # Hz, as Controller.CONTROL_RATE
+SIM_STEP = 0.001  # s, plant and camera resolution
+CAMERA_FPS = 60
+PIPELINE_LATENCY = 0.012  # capture to angle sample in the control process, s
+ANGLE_NOISE = 0.2  # deg, std of the measured angle
+TIMEOUT = 10.0  # s without reaching the goal
+SETTLE_TIME = 0.5  # s simulated after the stop command to see where the object ends up
+
+# name, controller class, keyword arguments
+VARIANTS = [
+    ("default %d ms" % round(ACTUATION_DELAY * 1e3), SlipController, dict()),
+    ("actuation 30 ms", SlipController, dict(actuation_delay=0.03)),
+    ("actuation 50 ms", SlipController, dict(actuation_delay=0.05)),
+    ("actuation 60 ms", SlipController, dict(actuation_delay=0.06)),
+]
+
+
+class SimClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ReplaySlot:
+    # Stands in for SeqlockSlot, written and read on the simulated clock
+    def __init__(self):
+        self.sample = 0
+        self.written = 0.0
+        self.values = None
+
+    def write(self, values, written):
+        self.sample += 1
+        self.written = written
+        self.values = np.array(values)
+
+    def read(self):
+        return self.sample, self.written, self.values
+
+
+class SlipPlant:
+    # Object held in the gripper, turning about the grasp under gravity. It sticks while the grip friction
+    # can hold it and slips (with lower kinetic friction) when it can't.
+    # Positions are Robotiq counts (0 open, 255 closed), the object touches the fingers at contact and the grip
+    # friction grows with how far past contact the fingers are. Angles are deg, 0 horizontal, hanging at 90.
+    # Also takes the controller's commands like GripperCommander, they reach the fingers after actuation_delay.
+    def __init__(self, clock, angle=0.0, contact=120, squeeze=20, gravity=2000.0, friction=150.0, kinetic=0.8,
+                 damping=2.0, finger_speed=300.0, actuation_delay=0.03):
+        self.clock = clock
+        self.angle = angle
+        self.velocity = 0.0
+        self.contact = contact
+        self.position = float(contact + squeeze)
+        self.target = self.position
+        self.gravity = gravity  # angular acceleration from gravity when horizontal, deg/s^2
+        self.friction = friction  # holding angular acceleration per count past contact, deg/s^2
+        self.kinetic = kinetic  # kinetic over static friction
+        self.damping = damping  # 1/s
+        self.finger_speed = finger_speed  # counts/s at full speed
+        self.speed = 255
+        self.actuation_delay = actuation_delay
+        self.settle_time = SETTLE_TIME
+
+        self.pending = []  # (time it takes effect, position, speed)
+        self.commanded = None
+        self.commands = 0
+
+    def command(self, position, speed=255, force=150, immediate=False):
+        self.pending.append((self.clock() + self.actuation_delay, position, speed))
+        self.commanded = int(position)
+        self.commands += 1
+
+    def reported_position(self):
+        return int(round(self.position))
+
+    def commanded_position(self):
+        return self.commanded
+
+    def tracking_error(self):
+        if self.commanded is None:
+            return None
+        return self.commanded - self.reported_position()
+
+    def step(self, dt):
+        while self.pending and self.pending[0][0] <= self.clock():
+            _, self.target, self.speed = self.pending.pop(0)
+        reach = self.finger_speed * self.speed / 255.0 * dt
+        self.position += np.clip(self.target - self.position, -reach, reach)
+
+        holding = self.friction * max(0.0, self.position - self.contact)
+        drive = self.gravity * np.cos(np.deg2rad(self.angle))
+        if self.velocity == 0 and abs(drive) <= holding:
+            return
+        direction = np.sign(self.velocity) if self.velocity else np.sign(drive)
+        accel = drive - direction * self.kinetic * holding - self.damping * self.velocity
+        velocity = self.velocity + accel * dt
+        if self.velocity and np.sign(velocity) != np.sign(self.velocity):
+            # Friction stopped it within the step
+            velocity = 0.0
+        self.angle += velocity * dt
+        self.velocity = velocity
+
+
+class RecordedTrial:
+    # Recorded angles played back open loop, the object does what it did in the recording whatever is commanded.
+    # The gripper follows commands instantly, so the controller sees its own commands as the reported position.
+    def __init__(self, clock, stamps, angles, gripper_width=0, actuation_delay=0.03):
+        found = ~np.isnan(angles)
+        self.clock = clock
+        self.stamps = stamps[found] - stamps[found][0]
+        # Unwrapped for interpolation, wrapped again when sampled like the detector output
+        self.angles = np.rad2deg(np.unwrap(np.deg2rad(angles[found])))
+        self.position = int(gripper_width)
+        self.actuation_delay = actuation_delay
+        # Only up to when the stop would reach the gripper, the recording doesn't react to it
+        self.settle_time = actuation_delay
+        self.commanded = None
+        self.commands = 0
+
+    @property
+    def angle(self):
+        return float(wrap_angle(np.interp(self.clock(), self.stamps, self.angles)))
+
+    @property
+    def duration(self):
+        return self.stamps[-1]
+
+    def command(self, position, speed=255, force=150, immediate=False):
+        self.position = self.commanded = int(position)
+        self.commands += 1
+
+    def reported_position(self):
+        return self.position
+
+    def commanded_position(self):
+        return self.commanded
+
+    def tracking_error(self):
+        return None if self.commanded is None else 0
+
+    def step(self, dt):
+        pass
+
+
+class ReplayCamera:
+    # Samples the source angle at the camera rate with measurement noise, filters it like the detector's Kalman
+    # tracker and hands (capture time, angle, velocity) to the slot after the pipeline latency
+    def __init__(self, source, clock, slot, rng, fps=CAMERA_FPS, latency=PIPELINE_LATENCY, noise=ANGLE_NOISE):
+        self.source = source
+        self.clock = clock
+        self.slot = slot
+        self.rng = rng
+        self.frame_dt = 1.0 / fps
+        self.latency = latency
+        self.noise = noise
+        self.kalman = AngleKalman()
+        self.next_capture = 0.0
+        self.in_flight = []  # (capture time, measured angle)
+
+    def step(self):
+        now = self.clock()
+        if now >= self.next_capture:
+            self.in_flight.append((now, self.source.angle + self.rng.normal(0, self.noise)))
+            self.next_capture += self.frame_dt
+        while self.in_flight and self.in_flight[0][0] + self.latency <= now:
+            captured, measured = self.in_flight.pop(0)
+            self.kalman.update(measured, captured)
+            self.slot.write((captured, self.kalman.angle, self.kalman.velocity), now)
+
+
+def replay_trial(make_source, controller_class=SlipController, controller_kwargs=None, speed=0.0, seed=0):
+    # Runs one trial to the stop command and SETTLE_TIME (or the source's settle_time) past it.
+    # speed 1.0 plays at the original timing, 0 as fast as possible.
+    clock = SimClock()
+    slot = ReplaySlot()
+    source = make_source(clock)
+    camera = ReplayCamera(source, clock, slot, np.random.default_rng(seed))
+    controller = controller_class(slot, source, clock=clock, **dict(controller_kwargs or {}))
+    timeout = getattr(source, "duration", TIMEOUT)
+
+    ticks_per_control = int(round(1.0 / (CONTROL_RATE * SIM_STEP)))
+    stop_time = None
+    stop_angle = None
+    max_angle = -np.inf
+    wall_start = timeit.default_timer()
+    step = 0
+    while True:
+        step += 1
+        clock.now = step * SIM_STEP
+        source.step(SIM_STEP)
+        camera.step()
+
+        if stop_time is not None:
+            max_angle = max(max_angle, source.angle)
+            if clock.now >= stop_time + source.settle_time:
+                break
+        elif step % ticks_per_control == 0:
+            if controller.control_loop():
+                stop_time = clock.now
+                stop_angle = source.angle
+            elif clock.now >= timeout:
+                break
+            if speed:
+                lag = clock.now / speed - (timeit.default_timer() - wall_start)
+                if lag > 0:
+                    time.sleep(lag)
+
+    return {
+        "reached": stop_time is not None,
+        "time_to_goal": stop_time,
+        "stop_angle": stop_angle,
+        # How far past the goal the object got before the stop took effect
+        "overshoot": max_angle - controller.goal if stop_time is not None else None,
+        "commands": source.commands,
+    }
+
+
+def csv_trial(path, actuation_delay=0.03):
+    # Angle CSV written by papilarray_bags_to_csv.py, the gripper width is in the file name:
+    # <name>_<number of df>_<twist>_<gripperTwist>_<eeGroundRot>_<eeAirRot>_<gripperWidth>_<largeChange>.csv
+    import pandas as pd
+
+    df = pd.read_csv(path, usecols=["true_angle", "timestep"])
+    stamps = df["timestep"].to_numpy(np.float64) * 1e-9
+    angles = df["true_angle"].to_numpy(np.float64)
+    gripper_width = float(os.path.basename(path)[:-4].split("_")[-2])
+    return lambda clock: RecordedTrial(clock, stamps, angles, gripper_width, actuation_delay)
+
+
+def frames_trial(folder, fps=CAMERA_FPS, actuation_delay=0.03):
+    # Folder of camera frames, numbered in capture order and fps apart, angles from the blob detector
+    from rotation_measurement.data_processing.blob_detector import AngleDetector
+
+    paths = glob.glob(os.path.join(folder, "*"))
+    paths = [p for p in paths if re.search(r"\d+", os.path.basename(p))]
+    paths.sort(key=lambda p: int(re.findall(r"\d+", os.path.basename(p))[-1]))
+    frames = np.stack([cv2.imread(p) for p in paths])
+    stamps = np.arange(len(frames)) / float(fps)
+    AD = AngleDetector(writeImages=False, showImages=False, cv2Image=True, recordVideo=False, useLUT=True)
+    angles, _ = AD.track_batch(frames, stamps)
+    return lambda clock: RecordedTrial(clock, stamps, angles, actuation_delay=actuation_delay)
+
+
+def plant_trials(count, seed=0):
+    # Plants with randomised grasps and objects
+    rng = np.random.default_rng(seed)
+    trials = []
+    for _ in range(count):
+        kwargs = dict(angle=rng.uniform(-20, 10), contact=int(rng.integers(80, 160)), squeeze=int(rng.integers(12, 30)),
+                      gravity=rng.uniform(1000, 3000), friction=rng.uniform(120, 200),
+                      actuation_delay=rng.uniform(0.02, 0.04))
+        trials.append(lambda clock, kwargs=kwargs: SlipPlant(clock, **kwargs))
+    return trials
+
+
+def run_variant(controller_class, kwargs, trials, speed):
+    # The controller prints every decision, keep that out of the terminal
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        return [replay_trial(trial, controller_class, kwargs, speed, seed=i) for i, trial in enumerate(trials)]
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def report(name, results, wall):
+    reached = [r for r in results if r["reached"]]
+    line = "%-16s reached %d/%d" % (name, len(reached), len(results))
+    if reached:
+        times = np.array([r["time_to_goal"] for r in reached])
+        overshoot = np.array([r["overshoot"] for r in reached])
+        commands = np.array([r["commands"] for r in reached])
+        line += "  time to goal mean %.2f p95 %.2f s  overshoot mean %.2f p95 %.2f max %.2f deg  commands %.1f" % (
+            times.mean(), np.percentile(times, 95), overshoot.mean(), np.percentile(overshoot, 95), overshoot.max(),
+            commands.mean())
+    print(line + "  (%.1f s)" % wall)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("recordings", nargs="*", help="angle CSVs or folders of frames, replayed open loop")
+    parser.add_argument("--plant", type=int, default=None, help="closed loop plant trials (200 without recordings)")
+    parser.add_argument("--speed", type=float, default=0.0, help="1 for the original timing, 0 as fast as possible")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    trials = [frames_trial(r) if os.path.isdir(r) else csv_trial(r) for r in args.recordings]
+    num_plant = args.plant if args.plant is not None else (0 if trials else 200)
+    if trials:
+        print("%d recorded trials, open loop" % len(trials))
+        for name, controller_class, kwargs in VARIANTS:
+            t1 = timeit.default_timer()
+            results = run_variant(controller_class, kwargs, trials, args.speed)
+            report(name, results, timeit.default_timer() - t1)
+    if num_plant:
+        trials = plant_trials(num_plant, args.seed)
+        print("%d plant trials, closed loop" % num_plant)
+        for name, controller_class, kwargs in VARIANTS:
+            t1 = timeit.default_timer()
+            results = run_variant(controller_class, kwargs, trials, args.speed)
+            report(name, results, timeit.default_timer() - t1)
@@ -0,0 +1,35 @@
+import timeit
+from multiprocessing import RawArray
+import numpy as np
+
+
+class SeqlockSlot:
+    # Latest value channel between processes: one writer overwrites a fixed size sample in shared memory,
+    # readers always get the newest complete sample and its sequence number, nobody ever waits on a lock.
+    # The sequence is odd while a write is in progress, a reader that sees it odd or changed retries.
+    # Create before forking, the memory is shared with the child processes.
+    def __init__(self, num_values):
+        self.num_values = num_values
+        # [sequence, write time, values...], float64 slots are written atomically on x86_64
+        self.buffer = RawArray("d", num_values + 2)
+        self.data = np.frombuffer(self.buffer, dtype=np.float64)
+        self.sequence = 0  # writer side copy
+
+    def write(self, values):
+        self.sequence += 1
+        self.data[0] = self.sequence  # odd: write in progress
+        self.data[2:] = values
+        self.data[1] = timeit.default_timer()
+        self.sequence += 1
+        self.data[0] = self.sequence
+
+    def read(self):
+        # (sample number, time it was written, values), sample number 0 until the first write
+        while True:
+            before = self.data[0]
+            if before % 2:
+                continue
+            written = self.data[1]
+            values = self.data[2:].copy()
+            if self.data[0] == before:
+                return int(before) // 2, written, values
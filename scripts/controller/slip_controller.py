@@ -0,0 +1,93 @@
+import timeit
+import numpy as np
+
+# Sample ages kept for the latency summary
+AGE_HISTORY = 4096
+
+# Gripper command to the grip taking effect, s: the driver forwarding the command plus the fingers closing in on
+# the object. The prediction extrapolates this far past the current time. It depends on the gripper, its driver and
+# the object, so measure it per setup (e.g. the time from a stop command to the angle levelling off, or sweep it in
+# python -m controller.replay) and set ~actuation_delay. The default only extrapolates to the current time.
+ACTUATION_DELAY = 0.0
+
+
+class SlipController:
+    # Decision logic of the adaptive slip controller, without ROS or the camera so it can be replayed offline.
+    # latest is read for the newest (capture time, angle, angular velocity) sample, like SeqlockSlot.read(),
+    # gripper takes the commands, like GripperCommander. clock is the time base of both.
+    def __init__(self, latest, gripper, goal=60, actuation_delay=ACTUATION_DELAY, clock=timeit.default_timer):
+        self.latest = latest
+        self.gripper = gripper
+        self.goal = goal
+        self.actuation_delay = actuation_delay
+        self.clock = clock
+
+        self.PUBLISH = True
+
+        self.prev_data = None
+        self.last_move_time = 0
+        self.last_sample = 0
+        self.skipped_samples = 0
+        # Age of each new sample when the control loop first saw it, measured from frame capture
+        self.sample_ages = np.zeros(AGE_HISTORY)
+        self.num_samples = 0
+
+    def print_sample_stats(self):
+        ages = self.sample_ages[: min(self.num_samples, AGE_HISTORY)] * 1e3
+        if len(ages):
+            print("samples used: %d, skipped: %d, age ms mean %.2f p99 %.2f max %.2f" % (
+                self.num_samples, self.skipped_samples, ages.mean(), np.percentile(ages, 99), ages.max()))
+
+    def control_loop(self):
+
+        sample, _, data = self.latest.read()
+
+        # camera is not initalised
+        if sample == 0:
+            return False
+
+        current_time = self.clock()
+
+        if sample != self.last_sample:
+            # Samples overwritten before the loop got to them
+            self.skipped_samples += sample - self.last_sample - 1
+            self.last_sample = sample
+            self.sample_ages[self.num_samples % AGE_HISTORY] = current_time - data[0]
+            self.num_samples += 1
+            self.prev_data = tuple(data)
+
+        (capture_time, angle, angleVel) = self.prev_data
+
+        # The sample describes the object at capture, predict where it will be when a command sent now takes effect.
+        # Extrapolating from the capture time covers the detection pipeline's latency as well.
+        time_since_capture = current_time - capture_time
+        object_angle = angle + angleVel * (time_since_capture + self.actuation_delay)
+
+        # Past the goal counts too, at speed the prediction can step over the 1 deg window between two ticks
+        if abs(self.goal - object_angle) < 1 or object_angle > self.goal or angle > self.goal:
+            print(self.goal, angle, object_angle, "sent stopped!!")
+            self.close_gripper()
+            return True
+
+        canMove = (current_time - self.last_move_time) > 0.05
+
+        # if the object is slow, and the gripper has opened
+        if angleVel < 0.3 and canMove:
+            print("loooooosen")
+            self.slightly_open_gripper()
+
+        return False
+
+    def slightly_open_gripper(self):
+        # One step open from where the gripper reports it is
+        position = self.gripper.reported_position() - 1
+
+        self.last_move_time = self.clock()
+
+        if self.PUBLISH:
+            print("open to", position, "commanded - reported", self.gripper.tracking_error())
+            self.gripper.command(position)
+
+    def close_gripper(self, width=255):
+        if self.PUBLISH:
+            self.gripper.command(width, immediate=True)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+import os
+import glob
+import time
+import threading
+import numpy as np
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+from scripts.util import CACHE_DIR
+
+ATTEMPT_LOG_DIR = os.path.join(CACHE_DIR, 'attempts')
+
+# One value per attempt
+ATTEMPT_COLUMNS = {
+    'time': np.float64,          # wall time the attempt started
+    'state': np.int8,            # box being picked from
+    'num_candidates': np.int32,
+    'num_bad_angle': np.int32,
+    'num_bad_plan': np.int32,
+    'found': np.bool_,           # a valid grasp was found
+    'chosen_index': np.int32,    # index into this attempt's candidates, -1 if none
+    'chosen_score': np.float32,
+    'chosen_angle': np.float32,  # approach angle to -z in deg
+    'search_time': np.float32,   # find_best_grasp duration in s
+    'motion_time': np.float32,   # run_motion duration in s
+    'dropped': np.bool_,
+}
+# One value per candidate, stored flat with a per attempt offset
+CANDIDATE_COLUMNS = {
+    'cand_position': (np.float32, 3),
+    'cand_approach': (np.float32, 3),
+    'cand_score': (np.float32, 1),
+}
+
+
+class AttemptLog:
+    # Append-only log of grasp attempts.
+    # log() only hands the row to a writer thread, which buffers rows and writes each
+    # segment_rows attempts to a new columnar .npz segment, so the control loop never touches disk.
+    # Rows are never buffered longer than flush_interval seconds, a crash loses at most that much.
+    def __init__(self, log_dir=ATTEMPT_LOG_DIR, segment_rows=64, flush_interval=30.0):
+        self.log_dir = log_dir
+        self.segment_rows = segment_rows
+        self.flush_interval = flush_interval
+        if not os.path.exists(self.log_dir):
+            os.makedirs(self.log_dir)
+
+        self.queue = Queue()
+        self.rows = []
+        # When the oldest buffered row has to be on disk
+        self.flush_time = None
+        self.writer = threading.Thread(target=self.write_loop)
+        self.writer.daemon = True
+        self.writer.start()
+
+    def log(self, **row):
+        self.queue.put(row)
+
+    def close(self):
+        # Flushes buffered rows and stops the writer
+        self.queue.put(None)
+        self.writer.join()
+
+    def write_loop(self):
+        while True:
+            timeout = max(0.0, self.flush_time - time.time()) if self.rows else None
+            try:
+                row = self.queue.get(timeout=timeout)
+            except Empty:
+                # Partial segment, read_attempts merges segments of any size
+                self.write_segment()
+                continue
+            if row is None:
+                self.write_segment()
+                return
+            if not self.rows:
+                self.flush_time = time.time() + self.flush_interval
+            self.rows.append(row)
+            if len(self.rows) >= self.segment_rows:
+                self.write_segment()
+
+    def write_segment(self):
+        if not self.rows:
+            return
+        rows, self.rows = self.rows, []
+
+        columns = {}
+        for name, dtype in ATTEMPT_COLUMNS.items():
+            columns[name] = np.array([row.get(name, -1) for row in rows], dtype=dtype)
+
+        counts = [len(row.get('cand_score', [])) for row in rows]
+        columns['cand_offset'] = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        for name, (dtype, width) in CANDIDATE_COLUMNS.items():
+            values = [np.asarray(row.get(name, []), dtype=dtype).reshape(-1, width) for row in rows]
+            columns[name] = np.concatenate(values).squeeze(axis=1) if width == 1 else np.concatenate(values)
+
+        # Segments sort by the time of their first attempt
+        name = 'attempts_%.6f_%d.npz' % (rows[0].get('time', time.time()), len(rows))
+        tmp_path = os.path.join(self.log_dir, name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **columns)
+        os.rename(tmp_path, os.path.join(self.log_dir, name))
+
+
+def read_attempts(log_dir=ATTEMPT_LOG_DIR, columns=None, start_time=None, end_time=None):
+    # Loads the requested columns of every segment into one array per column.
+    # Only the listed columns are read from disk, segments outside the time range are skipped and
+    # attempts outside it are dropped from the rest.
+    columns = list(ATTEMPT_COLUMNS) if columns is None else list(columns)
+    candidate_cols = [c for c in columns if c in CANDIDATE_COLUMNS]
+    if candidate_cols and 'cand_offset' not in columns:
+        columns.append('cand_offset')
+
+    parts = dict((c, []) for c in columns)
+    base = 0
+    for path in sorted(glob.glob(os.path.join(log_dir, 'attempts_*.npz'))):
+        seg_start = float(os.path.basename(path).split('_')[1])
+        if end_time is not None and seg_start > end_time:
+            continue
+        data = np.load(path)
+        times = data['time']
+        if start_time is not None and times[-1] < start_time:
+            continue
+        keep = np.ones(len(times), dtype=bool)
+        if start_time is not None:
+            keep &= times >= start_time
+        if end_time is not None:
+            keep &= times <= end_time
+        counts = np.diff(data['cand_offset'])
+        # Candidates belong to the attempt whose offset range they fall in
+        keep_cand = np.repeat(keep, counts)
+        counts = counts[keep]
+        for c in columns:
+            if c == 'cand_offset':
+                # Re-base offsets so they index into the concatenated candidate columns
+                parts[c].append(base + np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64))
+            elif c in CANDIDATE_COLUMNS:
+                parts[c].append(data[c][keep_cand])
+            else:
+                parts[c].append(data[c][keep])
+        base += int(counts.sum())
+
+    result = {}
+    for c in columns:
+        if parts[c]:
+            result[c] = np.concatenate(parts[c])
+        elif c in CANDIDATE_COLUMNS:
+            dtype, width = CANDIDATE_COLUMNS[c]
+            result[c] = np.zeros((0, width) if width > 1 else 0, dtype=dtype)
+        else:
+            result[c] = np.zeros(0, dtype=ATTEMPT_COLUMNS.get(c, np.int64))
+    if 'cand_offset' in result:
+        result['cand_offset'] = np.append(result['cand_offset'], base).astype(np.int64)
+    return result
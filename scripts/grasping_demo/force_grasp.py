@@ -20,7 +20,8 @@ from sensor_msgs.msg import JointState
 from actionlib_msgs.msg import GoalStatusArray
 from robotiq_2f_gripper_control.msg import _Robotiq2FGripper_robot_output as outputMsg, _Robotiq2FGripper_robot_input as inputMsg
 from scripts.gripper import open_gripper_msg, close_gripper_msg, activate_gripper_msg, reset_gripper_msg
-from scripts.util import dist_to_guess, vector3ToNumpy
+from scripts.util import dist_to_guess, vector3ToNumpy, check_valid_plan
+from scripts.grasping_demo.push_lattice import PushLattice
 
 from pyquaternion import Quaternion
 
@@ -80,6 +81,8 @@ class GraspExecutor:
         self.gripper_pub = rospy.Publisher('/Robotiq2FGripperRobotOutput', outputMsg.Robotiq2FGripper_robot_output, queue_size=1)
 
         self.latest_force = 0.0
+        # Skip the "Valid Trajectory" confirmation before each motion
+        self.dont_display_plan = False
 
         # Hard-coded joint values
         self.view_home_joints = [0.24985386431217194, -0.702608887349264, -2.0076406637774866, -1.7586587111102503, 1.5221580266952515, 0.25777095556259155]
@@ -97,6 +100,10 @@ class GraspExecutor:
         corner_4 = [-825,-100]
         self.corner_pos_list = [corner_1, corner_2, corner_3, corner_4]
 
+        # Corner pushes are planned once for the box and cached on disk
+        self.push_lattice = PushLattice(self.corner_pos_list, grasp_angle=30)
+        self.push_lattice.load_or_build(self.move_group, self.move_home_robot_state, self.move_home_joints)
+
         # AgileGrasp data
         self.agile_data = 0
         self.agile_state = AgileState.WAIT_FOR_ONE
@@ -116,11 +123,10 @@ class GraspExecutor:
 
     def find_best_grasp(self, data):
         # Determine the best grasp from agilegrasp grasp list
-        # Angle at which grasps are performed
-        grasp_angle = 30
         # Initialise values
         final_grasp_pose = 0
         final_grasp_pose_offset = 0
+        plan_offset = 0
         num_bad_angle = 0
         num_bad_plan = 0
         # Grasp pose list
@@ -147,59 +153,30 @@ class GraspExecutor:
             p_cam.header.frame_id = "camera_link"
             p_base = self.tf_listener_.transformPose("/base_link", p_cam)
 
-            # Find nearest corner
-            nearest_corner = self.find_nearest_corner(p_base)
-            # Convert positions to 2D
-            corner_pos = self.corner_pos_list(nearest_corner) # [x,y]
+            # Convert position to 2D
             grasp_pos = [p_base.pose.position.x, p_base.pose.position.y] # [x,y]
 
-            # Find approach angle
-            z_angle, offset_pos = self.calculate_approach(grasp_pos, corner_pos, -offset_dist)
-
-            # Print results
-            rospy.loginfo("Nearest corner: %d", nearest_corner)
-            rospy.loginfo("Corner Position - X: %d Y:%d", corner_pos[0], corner_pos[1])
-            rospy.loginfo("Grasp Position - X: %d Y:%d", grasp_pos[0], grasp_pos[1])
-            rospy.loginfo("Z-angle: %d", z_angle)
-
-            # Find angle of gripper to the ground from hard-coded value
-            y_angle = np.deg2rad(grasp_angle)
+            # The push starts offset_dist behind the object, on the far side from the nearest corner
+            nearest_corner = self.push_lattice.nearest_corner(grasp_pos)
+            approach = self.push_lattice.corners[nearest_corner] - np.array(grasp_pos)
+            offset_pos = np.array(grasp_pos) - offset_dist * approach / np.linalg.norm(approach)
 
-            # Generate pose
-            p_base = self.generate_push_pose(p_base, offset_pos[0], offset_pos[0], y_angle, z_angle)
-
-            # Create offset pose
-            p_base_offset = copy.deepcopy(p_base)
-            p_base_offset.pose.position.x -= offset_pos[0] *offset_dist
-            p_base_offset.pose.position.y -= offset_pos[1] *offset_dist
+            # Closest precomputed push start to that point (lattice only holds nodes with valid plans), None when the
+            # lattice has no node near it behind the object, the push would miss
+            push_node = self.push_lattice.nearest_node(offset_pos, nearest_corner, grasp_pos)
 
             # Add pose to pose list
             poses.append(copy.deepcopy(p_base.pose))
-            
-            # Check path planning from home state to final grasp pose
-            self.move_group.set_start_state(self.move_home_robot_state)
-            self.move_group.set_pose_target(p_base)
-            plan_to_final = self.move_group.plan()
-            # Clear target
-            self.move_group.clear_pose_targets()
-            # If plan is valid
-            if plan_to_final.joint_trajectory.points:
-                # Check path planning from home state to offset grasp pos
-                self.move_group.set_start_state(self.move_home_robot_state)
-                self.move_group.set_pose_target(p_base_offset)
-                plan_offset = self.move_group.plan()
-                # If we can move to offset position
-                if plan_offset.joint_trajectory.points:
-                    # Use current poses as final grasp poses
-                    final_grasp_pose = p_base
-                    final_grasp_pose_offset = p_base_offset
-                    rospy.loginfo("Final grasp found!")
-                    poses = [poses[-1]]
-                    break
-                else:
-                    rospy.loginfo("Invalid path")
-                    num_bad_plan += 1
 
+            if push_node is not None:
+                # Push start pose and its cached plan from home, push trajectory is in the node
+                final_grasp_pose_offset = push_node['pose']
+                plan_offset = push_node['approach_plan']
+                final_grasp_pose = push_node
+                rospy.loginfo("Final grasp found!")
+                rospy.loginfo("Nearest corner: %d", push_node['corner'])
+                poses = [poses[-1]]
+                break
             else:
                 rospy.loginfo("Invalid path")
                 num_bad_plan += 1
@@ -209,18 +186,12 @@ class GraspExecutor:
         posearray.poses = poses
         posearray.header.frame_id = "base_link"
 
-        rospy.loginfo("final_grasp_pose", final_grasp_pose)
         # Publish grasp array
         self.pose_publisher.publish(posearray)
         # Print number of invalid plans
         rospy.loginfo("# bad angle: " + str(num_bad_angle))
         rospy.loginfo("# bad plan: " + str(num_bad_plan))
 
-        # If there is no valid grasp
-        if not final_grasp_pose:
-            # Offset value is 0
-            plan_offset = 0
-
         return final_grasp_pose_offset, plan_offset, final_grasp_pose
 
     def find_nearest_corner(self, p_base):
@@ -245,7 +216,7 @@ class GraspExecutor:
         x_diff = final_pos[0] - start_pos[0]
         y_diff = final_pos[1] - start_pos[1]
         # Angle of the gripper to the corner (in z-axis)
-        z_angle = atan2(y_diff, x_diff)
+        z_angle = math.atan2(y_diff, x_diff)
 
         # Calculate offset position
         v = np.array([x_diff, y_diff])
@@ -275,40 +246,34 @@ class GraspExecutor:
 
         return current_pose
 
-    def force_grasp(self, corner_pos):
+    def force_grasp(self, push_node):
+        # Returns False if the push wasn't confirmed, the gripper is then left open
         threshold = 1
-        push_dist = 0.01
+        push_plan = push_node['push_plan']
+        push_time = push_plan.joint_trajectory.points[-1].time_from_start.to_sec()
+        if not (self.dont_display_plan or check_valid_plan(self.display_trajectory_publisher, self.robot, push_plan)):
+            rospy.loginfo("Push not confirmed!")
+            return False
+        # Run the cached push into the corner and cut it short on contact
+        self.move_group.execute(push_plan, wait=False)
+        end_time = rospy.get_time() + push_time
         # Check force feedback
-        force_feedback = self.latest_force
-        # While force less then threshold value
-        while force_feedback < threshold:
-            # Move towards corner
-            new_pose = self.move_group.get_current_pose()
-            # Find current 2D co-ordinates
-            current_pos = [new_pose.pose.position.x, new_pose.pose.position.y]
-            # Find approach angle
-            z_angle, new_pos = self.calculate_approach(current_pos, corner_pos, push_dist)
-            # Find angle of gripper to the ground from hard-coded value
-            y_angle = np.deg2rad(grasp_angle)
-
-            # Generate new pose
-            new_pose = self.generate_push_pose(new_pos[0], new_pos[1], y_angle, z_angle)
-
-            self.move_to_position(new_pose)
-            # Check force feedback
-            force_feedback = self.latest_force
-        else:
-            # Close gripper
-            self.command_gripper(close_gripper_msg())
+        while self.latest_force < threshold and rospy.get_time() < end_time and not rospy.is_shutdown():
+            rospy.sleep(0.01)
+        self.move_group.stop()
+        # Close gripper
+        self.command_gripper(close_gripper_msg())
+        return True
 
     def run_motion(self, state, final_grasp_pose_offset, plan_offset, final_grasp_pose):
         if state == State.FIRST_GRAB:
             self.move_group.set_start_state_to_current_state()
             self.move_to_joint_position(self.move_home_joints)
-            self.move_to_position(final_grasp_pose_offset, plan_offset)
-            self.move_to_position(final_grasp_pose)
-            # force grasp
-            self.force_grasp(self, final_grasp_pose)
+            # force grasp, only once the robot is actually at the start of the push
+            if not self.move_to_position(final_grasp_pose_offset, plan_offset) or not self.force_grasp(final_grasp_pose):
+                self.move_to_joint_position(self.move_home_joints)
+                self.move_to_joint_position(self.view_home_joints)
+                return
 
             self.move_to_position(self.lift_up_pose())
 
@@ -336,44 +301,30 @@ class GraspExecutor:
         if not plan:
             plan = self.move_group.plan()
 
-        run_flag = "d"
-
-        while run_flag == "d":
-            display_trajectory = moveit_msgs.msg.DisplayTrajectory()
-            display_trajectory.trajectory_start = self.robot.get_current_state()
-            display_trajectory.trajectory.append(plan)
-            self.display_trajectory_publisher.publish(display_trajectory)
-
-            run_flag = raw_input("Valid Trajectory [y to run]? or display path again [d to display]:")
-
-        if run_flag =="y":
+        # Operator confirms every motion unless dont_display_plan is set
+        run = self.dont_display_plan or check_valid_plan(self.display_trajectory_publisher, self.robot, plan)
+        if run:
             self.move_group.execute(plan, wait=True)
 
 
         self.move_group.stop()
         self.move_group.clear_pose_targets()
+        return run
 
     def move_to_joint_position(self, joint_array, plan=None):
         self.move_group.set_joint_value_target(joint_array)
         if not plan:
             plan = self.move_group.plan()
 
-        run_flag = "d"
-
-        while run_flag == "d":
-            display_trajectory = moveit_msgs.msg.DisplayTrajectory()
-            display_trajectory.trajectory_start = self.robot.get_current_state()
-            display_trajectory.trajectory.append(plan)
-            self.display_trajectory_publisher.publish(display_trajectory)
-
-            run_flag = raw_input("Valid Trajectory [y to run]? or display path again [d to display]:")
-
-        if run_flag =="y":
+        # Operator confirms every motion unless dont_display_plan is set
+        run = self.dont_display_plan or check_valid_plan(self.display_trajectory_publisher, self.robot, plan)
+        if run:
             self.move_group.execute(plan, wait=True)
 
 
         self.move_group.stop()
         self.move_group.clear_pose_targets()
+        return run
 
     def get_drop_pose(self):
         drop = PoseStamped()
@@ -25,8 +25,10 @@ from geometry_msgs.msg import PoseStamped, WrenchStamped, PoseArray
 from robotiq_2f_gripper_control.msg import _Robotiq2FGripper_robot_output as outputMsg, _Robotiq2FGripper_robot_input as inputMsg
 
 from scripts.gripper import open_gripper_msg, close_gripper_msg, activate_gripper_msg, reset_gripper_msg
-from scripts.util import dist_to_guess, vector3ToNumpy, move_ur5
+from scripts.util import dist_to_guess, vector3ToNumpy, move_ur5, move_ur5_through
 from grasp_executor.srv import PCLStitch
+from scripts.grasping_demo.grasp_ranker import RANKERS, cloud_to_numpy
+from scripts.grasping_demo.attempt_log import AttemptLog
 
 
 
@@ -75,7 +77,23 @@ class GraspExecutor:
         self.move_home_robot_state = self.get_robot_state(self.move_home_joints)
 
         self.dont_display_plan = True
-        self.choose_random = True
+        # Try grasps in a random order instead of ranking them, the ranker still learns from the outcomes
+        self.choose_random = rospy.get_param("~choose_random", False)
+
+        # Grasp ranking, learned (online from run_motion outcomes) or agile_score (agile score only)
+        ranker = rospy.get_param("~ranker", "learned")
+        if ranker not in RANKERS:
+            raise ValueError("Unknown ranker %s, expected one of %s" % (ranker, ", ".join(RANKERS)))
+        self.ranker = RANKERS[ranker]()
+        rospy.loginfo("Ranking grasps with %s%s", ranker, " (random order)" if self.choose_random else "")
+        self.cloud_xyz = None
+        self.chosen_features = None
+        self.chosen_position = None
+
+        # Outcome of every attempt, written in the background
+        self.attempt_log = AttemptLog()
+        self.search_stats = {}
+        rospy.on_shutdown(self.attempt_log.close)
 
         # Initializations
         self.state = State.BOOTUP
@@ -125,19 +143,25 @@ class GraspExecutor:
 
         num_bad_angle = 0
         num_bad_plan = 0
+        chosen_index = -1
+        chosen_angle = -1
 
         poses = []
         if choose_random:
             #Shuffle grasps
             random.shuffle(data.grasps)
+            features = self.ranker.features(data.grasps, self.workspaces[self.state], self.cloud_xyz)
             rospy.loginfo('Grasps shuffled!')
         else:
-            # Sort grasps by quality
-            data.grasps.sort(key=lambda x : x.score, reverse=True)
-            rospy.loginfo("Grasps Sorted!")
+            # Rank grasps by predicted success
+            features = self.ranker.features(data.grasps, self.workspaces[self.state], self.cloud_xyz)
+            order = self.ranker.rank(features)
+            data.grasps = [data.grasps[i] for i in order]
+            features = features[order]
+            rospy.loginfo("Grasps ranked!")
         
         # loop through grasps from high to low quality
-        for g in data.grasps:
+        for i, g in enumerate(data.grasps):
             if rospy.is_shutdown():
                 break
             
@@ -205,6 +229,11 @@ class GraspExecutor:
                         # If so, we've found the grasp to use
                         final_grasp_pose = p_base
                         final_grasp_pose_offset = p_base_offset
+                        # Kept to train the ranker on the outcome
+                        self.chosen_features = features[i]
+                        self.chosen_position = vector3ToNumpy(position)
+                        chosen_index = i
+                        chosen_angle = theta_approach
                         rospy.loginfo("Final grasp found!")
                         rospy.loginfo(" Angle: %.4f",  theta_approach)
                         # Only display the grasp being used
@@ -235,15 +264,32 @@ class GraspExecutor:
             plan_offset = 0
             rospy.loginfo("No valid grasp found!")
 
+        # For the attempt log
+        self.search_stats = {
+            'num_candidates': len(data.grasps),
+            'num_bad_angle': num_bad_angle,
+            'num_bad_plan': num_bad_plan,
+            'chosen_index': chosen_index,
+            'chosen_score': data.grasps[chosen_index].score if chosen_index >= 0 else -1,
+            'chosen_angle': chosen_angle,
+            'cand_position': [vector3ToNumpy(g.surface) for g in data.grasps],
+            'cand_approach': [vector3ToNumpy(g.approach) for g in data.grasps],
+            'cand_score': [g.score for g in data.grasps],
+        }
+
         return final_grasp_pose_offset, plan_offset, final_grasp_pose
 
     # Use class variables to move to a pose
-    def move_to_position(self, grasp_pose, plan=None):
-        move_ur5(self.move_group, self.robot, self.display_trajectory_publisher, grasp_pose, plan, no_confirm=self.dont_display_plan)
+    def move_to_position(self, grasp_pose, plan=None, profile=None):
+        move_ur5(self.move_group, self.robot, self.display_trajectory_publisher, grasp_pose, plan, no_confirm=self.dont_display_plan, profile=profile)
 
     # Use class variables to move to a joint angle pose
-    def move_to_joint_position(self, joint_array, plan=None):
-        move_ur5(self.move_group, self.robot, self.display_trajectory_publisher, joint_array, plan, no_confirm=self.dont_display_plan)
+    def move_to_joint_position(self, joint_array, plan=None, profile=None):
+        move_ur5(self.move_group, self.robot, self.display_trajectory_publisher, joint_array, plan, no_confirm=self.dont_display_plan, profile=profile)
+
+    # Use class variables to move through several joint angle poses without stopping in between
+    def move_through_joint_positions(self, joint_arrays, profile=None):
+        move_ur5_through(self.move_group, self.robot, self.display_trajectory_publisher, joint_arrays, no_confirm=self.dont_display_plan, profile=profile)
 
     # Publish a msg to the gripper
     def command_gripper(self, grip_msg):
@@ -266,34 +312,40 @@ class GraspExecutor:
 
         #Move home
         self.move_group.set_start_state_to_current_state()
-        self.move_to_joint_position(self.move_home_joints)
+        self.move_to_joint_position(self.move_home_joints, profile='empty')
         rospy.sleep(0.2)
 
         #Grab object
-        self.move_to_position(final_grasp_pose_offset, plan_offset)
+        self.move_to_position(final_grasp_pose_offset, plan_offset, profile='near_box')
         rospy.sleep(0.2)
-        self.move_to_position(final_grasp_pose)
+        self.move_to_position(final_grasp_pose, profile='approach')
         rospy.sleep(0.2)
         self.command_gripper(close_gripper_msg())
         rospy.sleep(1)
 
         #Move to drop position, checking if the object is dropped
-        self.move_to_position(self.lift_up_pose())
+        self.move_to_position(self.lift_up_pose(), profile='carrying')
         rospy.sleep(0.2)
 
-        joints_to_move_to = [self.move_home_joints, drop_joints]
-        for joints in joints_to_move_to:
-            rospy.sleep(0.5)
-            if self.gripper_data.gOBJ == 3:
-                rospy.loginfo("Robot has missed/dropped object!")
-                dropped_flag = True
-                return True
-            self.move_to_joint_position(joints)
-        
+        rospy.sleep(0.5)
+        if self.gripper_data.gOBJ == 3:
+            rospy.loginfo("Robot has missed/dropped object!")
+            dropped_flag = True
+            return True
+        # Home and on to the drop box in one blended motion
+        self.move_through_joint_positions([self.move_home_joints, drop_joints], profile='carrying')
+
+        # And again before the drop, the object can fall anywhere along the blended motion
+        rospy.sleep(0.5)
+        if self.gripper_data.gOBJ == 3:
+            rospy.loginfo("Robot has missed/dropped object!")
+            dropped_flag = True
+            return True
+
         #Drop object
         self.command_gripper(open_gripper_msg())
         rospy.sleep(0.5)
-        self.move_to_joint_position(self.move_home_joints)
+        self.move_to_joint_position(self.move_home_joints, profile='empty')
         rospy.sleep(0.2)
 
         return dropped_flag
@@ -354,6 +406,7 @@ class GraspExecutor:
             rospy.loginfo("Generating point cloud")
             point_cloud = self.generate_pcl(int(self.state)) #### TODO: set generate_pcl input based on state
             self.PCL_stitched_publisher.publish(point_cloud.cloud)
+            self.cloud_xyz = cloud_to_numpy(point_cloud.cloud)
             rospy.loginfo("Point cloud generated")
 
             #Wait for a valid reading from agile grasp
@@ -369,22 +422,32 @@ class GraspExecutor:
             ####TODO: sample from list randomly instead maybe?
             #Find best grasp from reading
             rospy.loginfo("Finding valid grasp")
+            attempt_start = rospy.get_time()
             final_grasp_pose_offset, plan_offset, final_grasp_pose = self.find_best_grasp(self.agile_data, self.choose_random)
+            search_time = rospy.get_time() - attempt_start
             
             drop_flag = None
+            motion_time = 0
             if final_grasp_pose:
                 rospy.loginfo("Grasp found! Executing grasp")
                 #Run the current motion on it 
+                motion_start = rospy.get_time()
                 drop_flag = self.run_motion(self.state, final_grasp_pose_offset, plan_offset, final_grasp_pose)
+                motion_time = rospy.get_time() - motion_start
+                self.ranker.update(self.chosen_features, not drop_flag, self.chosen_position)
             else:
                 rospy.loginfo("No pose target generated!")
 
+            self.attempt_log.log(time=attempt_start, state=int(self.state), found=bool(final_grasp_pose),
+                                 search_time=search_time, motion_time=motion_time, dropped=bool(drop_flag),
+                                 **self.search_stats)
+
             rospy.loginfo("Switching state!")
             self.state = STATE_TRANSITION[self.state]
             ws_curr = self.workspaces[self.state]
 
             rospy.loginfo("Moving home")
-            self.move_to_joint_position(self.move_home_joints)
+            self.move_to_joint_position(self.move_home_joints, profile='empty')
             self.command_gripper(open_gripper_msg())
             rospy.sleep(.1)
             
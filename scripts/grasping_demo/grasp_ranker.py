@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+import os
+import numpy as np
+
+import rospy
+from sensor_msgs import point_cloud2
+from scripts.util import CACHE_DIR, vector3ToNumpy
+
+RANKER_PATH = os.path.join(CACHE_DIR, 'grasp_ranker.npz')
+
+# Feature columns, see GraspRanker.features
+FEATURE_NAMES = ['bias', 'score', 'approach', 'wall_dist', 'density', 'nearby_success', 'nearby_weight']
+
+
+def cloud_to_numpy(cloud):
+    # sensor_msgs/PointCloud2 -> Nx3 array
+    points = point_cloud2.read_points(cloud, field_names=('x', 'y', 'z'), skip_nans=True)
+    return np.array(list(points), dtype=np.float32).reshape(-1, 3)
+
+
+class AgileScoreRanker:
+    # Default ranking, agile_grasp2 score only
+    def features(self, grasps, workspace=None, cloud_xyz=None):
+        if not grasps:
+            return np.zeros((0, 1))
+        return np.array([g.score for g in grasps], dtype=float)[:, None]
+
+    def rank(self, features):
+        return np.argsort(-features[:, 0], kind='stable')
+
+    def update(self, feature_row, success, position=None):
+        pass
+
+
+class GraspRanker:
+    # Online logistic model of grasp success from cheap geometric features.
+    # Starts out equal to ranking by agile score and learns from each run_motion outcome.
+    def __init__(self, path=RANKER_PATH, learning_rate=0.05, weight_decay=1e-3,
+                 voxel_size=0.01, density_radius=1, neighbour_radius=0.03):
+        self.path = path
+        self.learning_rate = learning_rate
+        self.weight_decay = weight_decay
+        self.voxel_size = voxel_size
+        # Density counted in a (2r+1)^3 voxel block around the grasp
+        self.density_radius = density_radius
+        self.neighbour_radius = neighbour_radius
+
+        self.weights = np.zeros(len(FEATURE_NAMES))
+        self.weights[FEATURE_NAMES.index('score')] = 1.0
+        # Past attempts, grasp positions and 0/1 outcomes
+        self.history_pos = np.zeros((0, 3))
+        self.history_success = np.zeros(0)
+
+        if os.path.exists(self.path):
+            self.load()
+
+    def load(self):
+        data = np.load(self.path)
+        if data['weights'].shape == self.weights.shape:
+            self.weights = data['weights']
+        self.history_pos = data['history_pos']
+        self.history_success = data['history_success']
+        rospy.loginfo("Loaded grasp ranker with %d past attempts", len(self.history_success))
+
+    def save(self):
+        if not os.path.exists(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path))
+        np.savez(self.path, weights=self.weights, history_pos=self.history_pos, history_success=self.history_success)
+
+    def point_density(self, positions, cloud_xyz):
+        # Number of cloud points in the voxel block around each position
+        if cloud_xyz is None or len(cloud_xyz) == 0:
+            return np.zeros(len(positions))
+
+        r = self.density_radius
+        # Only the cloud around the candidates matters, keeps the grid small
+        margin = (r + 1) * self.voxel_size
+        keep = np.all((cloud_xyz >= positions.min(axis=0) - margin) & (cloud_xyz <= positions.max(axis=0) + margin), axis=1)
+        if not keep.any():
+            return np.zeros(len(positions))
+        cloud_vox = np.floor(cloud_xyz[keep] / self.voxel_size).astype(np.int64)
+        vox, counts = np.unique(cloud_vox, axis=0, return_counts=True)
+        # Integral image over a dense grid covering the cloud, padded by r on each side
+        origin = vox.min(axis=0) - r
+        shape = vox.max(axis=0) - origin + r + 1
+        grid = np.zeros(shape + 1, dtype=np.int64)
+        idx = vox - origin + 1
+        grid[idx[:, 0], idx[:, 1], idx[:, 2]] = counts
+        grid = grid.cumsum(0).cumsum(1).cumsum(2)
+
+        query = np.floor(positions / self.voxel_size).astype(np.int64) - origin
+        lo = np.clip(query - r, 0, shape)
+        hi = np.clip(query + r + 1, 0, shape)
+        return (grid[hi[:, 0], hi[:, 1], hi[:, 2]]
+                - grid[lo[:, 0], hi[:, 1], hi[:, 2]] - grid[hi[:, 0], lo[:, 1], hi[:, 2]] - grid[hi[:, 0], hi[:, 1], lo[:, 2]]
+                + grid[lo[:, 0], lo[:, 1], hi[:, 2]] + grid[lo[:, 0], hi[:, 1], lo[:, 2]] + grid[hi[:, 0], lo[:, 1], lo[:, 2]]
+                - grid[lo[:, 0], lo[:, 1], lo[:, 2]]).astype(float)
+
+    def nearby_outcomes(self, positions):
+        # Gaussian weighted success rate of past attempts near each position, and the total weight
+        if len(self.history_success) == 0:
+            return np.full(len(positions), 0.5), np.zeros(len(positions))
+
+        d2 = ((positions[:, None, :] - self.history_pos[None, :, :]) ** 2).sum(axis=2)
+        w = np.exp(-0.5 * d2 / self.neighbour_radius ** 2)
+        total = w.sum(axis=1)
+        # Prior of one half-success attempt keeps sparse neighbourhoods near 0.5
+        rate = (w.dot(self.history_success) + 0.5) / (total + 1)
+        return rate, total
+
+    def features(self, grasps, workspace, cloud_xyz=None):
+        if not grasps:
+            return np.zeros((0, len(FEATURE_NAMES)))
+        positions = np.array([vector3ToNumpy(g.surface) for g in grasps])
+        approach = np.array([vector3ToNumpy(g.approach) for g in grasps])
+        approach = approach / np.linalg.norm(approach, axis=1, keepdims=True)
+        scores = np.array([g.score for g in grasps], dtype=float)
+
+        f = np.zeros((len(grasps), len(FEATURE_NAMES)))
+        f[:, 0] = 1
+        # Scores are normalised per batch so the model is independent of agile's scale
+        f[:, 1] = (scores - scores.mean()) / (scores.std() + 1e-9)
+        # cos of the angle between the approach and -z (1 = straight down)
+        f[:, 2] = -approach[:, 2]
+        # Distance to the closest box wall in cm, workspace is [xmin, xmax, ymin, ymax, zmin, zmax]
+        ws = np.asarray(workspace, dtype=float)
+        walls = np.stack([positions[:, 0] - ws[0], ws[1] - positions[:, 0],
+                          positions[:, 1] - ws[2], ws[3] - positions[:, 1]], axis=1)
+        f[:, 3] = np.clip(walls.min(axis=1), 0, None) * 100
+        f[:, 4] = np.log1p(self.point_density(positions, cloud_xyz))
+        f[:, 5], f[:, 6] = self.nearby_outcomes(positions)
+        f[:, 6] = np.log1p(f[:, 6])
+        return f
+
+    def predict(self, features):
+        return 1 / (1 + np.exp(-features.dot(self.weights)))
+
+    def rank(self, features):
+        return np.argsort(-self.predict(features), kind='stable')
+
+    def update(self, feature_row, success, position=None):
+        # One SGD step on the logistic loss for the attempted grasp
+        success = float(success)
+        p = self.predict(feature_row[None, :])[0]
+        grad = (p - success) * feature_row + self.weight_decay * self.weights
+        self.weights = self.weights - self.learning_rate * grad
+
+        if position is not None:
+            self.history_pos = np.vstack([self.history_pos, position])
+            self.history_success = np.append(self.history_success, success)
+        self.save()
+        rospy.loginfo("Grasp ranker updated, p(success) was %.2f, outcome %d", p, success)
+
+
+# Rankers selectable with the grasp executor's ~ranker param
+RANKERS = {
+    'learned': GraspRanker,
+    'agile_score': AgileScoreRanker,
+}
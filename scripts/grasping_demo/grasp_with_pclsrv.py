@@ -24,7 +24,7 @@ from geometry_msgs.msg import PoseStamped, WrenchStamped, PoseArray
 from robotiq_2f_gripper_control.msg import _Robotiq2FGripper_robot_output as outputMsg, _Robotiq2FGripper_robot_input as inputMsg
 
 from scripts.gripper import open_gripper_msg, close_gripper_msg, activate_gripper_msg, reset_gripper_msg
-from scripts.util import dist_to_guess, vector3ToNumpy, move_ur5
+from scripts.util import dist_to_guess, vector3ToNumpy, move_ur5, move_ur5_through
 from grasp_executor.srv import PCLStitch
 
 
@@ -223,6 +223,10 @@ class GraspExecutor:
     def move_to_joint_position(self, joint_array, plan=None):
         move_ur5(self.move_group, self.robot, self.display_trajectory_publisher, joint_array, plan)
 
+    # Use class variables to move through several joint angle poses without stopping in between
+    def move_through_joint_positions(self, joint_arrays, profile=None):
+        move_ur5_through(self.move_group, self.robot, self.display_trajectory_publisher, joint_arrays, profile=profile)
+
     # Publish a msg to the gripper
     def command_gripper(self, grip_msg):
         self.gripper_pub.publish(grip_msg)
@@ -258,16 +262,12 @@ class GraspExecutor:
             rospy.sleep(1)
             if self.gripper_data.gOBJ == 3:
                 rospy.loginfo("Robot has missed/dropped object!")
-                self.move_to_joint_position(self.move_home_joints)
-                self.move_to_joint_position(self.view_home_joints)
+                self.move_through_joint_positions([self.move_home_joints, self.view_home_joints])
             else:
-                # Go to move home position using joint
-                self.move_to_joint_position(self.move_home_joints)
-
-                self.move_to_joint_position(self.drop_object_joints)
+                # Go through move home position to the drop position using joint
+                self.move_through_joint_positions([self.move_home_joints, self.drop_object_joints], profile='carrying')
                 self.command_gripper(open_gripper_msg())
-                self.move_to_joint_position(self.move_home_joints)
-                self.move_to_joint_position(self.view_home_joints)
+                self.move_through_joint_positions([self.move_home_joints, self.view_home_joints])
 
                 self.state = State.SECOND_GRAB
 
@@ -283,13 +283,10 @@ class GraspExecutor:
             rospy.sleep(1)
             if self.gripper_data.gOBJ == 3:
                 rospy.loginfo("Robot has missed/dropped object!")
-                self.move_to_joint_position(self.move_home_joints)
-                self.move_to_joint_position(self.view_home_joints)
+                self.move_through_joint_positions([self.move_home_joints, self.view_home_joints])
             else:
-                # Go to move home position using joint
-                self.move_to_joint_position(self.move_home_joints)
-
-                self.move_to_joint_position(self.deliver_object_joints)
+                # Go through move home position to the deliver position using joint
+                self.move_through_joint_positions([self.move_home_joints, self.deliver_object_joints], profile='carrying')
                 self.command_gripper(open_gripper_msg())
                 self.move_to_joint_position(self.move_home_joints)
 
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+import os
+import math
+import copy
+import pickle
+import hashlib
+import numpy as np
+import tf
+
+import rospy
+from geometry_msgs.msg import PoseStamped
+from sensor_msgs.msg import JointState
+from std_msgs.msg import Header
+from moveit_msgs.msg import RobotState
+from scripts.util import CACHE_DIR
+
+# Corners are given in mm (same as the agile_grasp workspace), poses are in m
+MM_TO_M = 0.001
+
+# Furthest a lattice node may be from the requested push start and still stand in for it, about one radius step
+NODE_TOLERANCE = 0.025
+
+JOINT_NAMES = ['shoulder_pan_joint', 'shoulder_lift_joint',  'elbow_joint', 'wrist_1_joint', 'wrist_2_joint', 'wrist_3_joint']
+
+
+class PushLattice:
+    # Precomputed corner pushes for a fixed box.
+    # Each corner gets a fan of approach headings inside the box, and each heading a line
+    # of start points (radii) back from the corner. For every (corner, heading, radius) node we
+    # keep the plan from the home state to the start pose and the cartesian push into the corner,
+    # so a corner push can be executed without any planning at grasp time.
+    def __init__(self, corner_pos_list, grasp_angle=30, push_height=0.08, push_dist=0.01,
+                 num_headings=5, radii=(0.04, 0.06, 0.08, 0.10, 0.12, 0.14, 0.16, 0.18, 0.20)):
+        self.corners = np.array(corner_pos_list, dtype=float) * MM_TO_M
+        self.grasp_angle = grasp_angle
+        self.push_height = push_height
+        self.push_dist = push_dist
+        self.num_headings = num_headings
+        self.radii = np.array(radii, dtype=float)
+
+        self.nodes = []
+        # [corner, heading, radius] -> index into self.nodes (-1 when no valid plan)
+        self.node_index = -np.ones((len(self.corners), num_headings, len(self.radii)), dtype=int)
+        # xy of every start point, same shape as node_index
+        self.start_xy = np.zeros((len(self.corners), num_headings, len(self.radii), 2))
+        self.headings = np.zeros((len(self.corners), num_headings))
+
+        self.compute_geometry()
+
+    def compute_geometry(self):
+        # Headings fan out between the two walls meeting at each corner (walls excluded)
+        n = len(self.corners)
+        for i in range(n):
+            corner = self.corners[i]
+            wall_a = self.corners[i - 1] - corner
+            wall_b = self.corners[(i + 1) % n] - corner
+            angle_a = math.atan2(wall_a[1], wall_a[0])
+            angle_b = math.atan2(wall_b[1], wall_b[0])
+            # Take the short way round between the walls
+            span = (angle_b - angle_a + np.pi) % (2 * np.pi) - np.pi
+            self.headings[i] = angle_a + span * np.linspace(0, 1, self.num_headings + 2)[1:-1]
+
+            direction = np.stack([np.cos(self.headings[i]), np.sin(self.headings[i])], axis=1)
+            self.start_xy[i] = corner + direction[:, None, :] * self.radii[None, :, None]
+
+    def cache_key(self, home_joints):
+        params = (np.round(self.corners, 4).tolist(), self.grasp_angle, self.push_height, self.push_dist,
+                  self.num_headings, np.round(self.radii, 4).tolist(), np.round(home_joints, 4).tolist())
+        return hashlib.md5(repr(params).encode()).hexdigest()[:12]
+
+    def cache_path(self, home_joints):
+        return os.path.join(CACHE_DIR, 'push_lattice_' + self.cache_key(home_joints) + '.pkl')
+
+    def push_pose(self, xy, heading):
+        # Gripper points back along the heading (towards the corner), tilted down by grasp_angle
+        pose = PoseStamped()
+        pose.header.frame_id = "base_link"
+        pose.pose.position.x = xy[0]
+        pose.pose.position.y = xy[1]
+        pose.pose.position.z = self.push_height
+
+        z_angle = heading + np.pi
+        quaternion = tf.transformations.quaternion_from_euler(0, np.deg2rad(self.grasp_angle), z_angle)
+        pose.pose.orientation.x = quaternion[0]
+        pose.pose.orientation.y = quaternion[1]
+        pose.pose.orientation.z = quaternion[2]
+        pose.pose.orientation.w = quaternion[3]
+        return pose
+
+    def push_waypoints(self, start_pose, corner, heading):
+        # Straight line from the start pose into the corner, one waypoint every push_dist
+        start = np.array([start_pose.pose.position.x, start_pose.pose.position.y])
+        length = np.linalg.norm(corner - start)
+        steps = max(1, int(np.ceil(length / self.push_dist)))
+        waypoints = []
+        for s in range(1, steps + 1):
+            p = copy.deepcopy(start_pose.pose)
+            xy = start + (corner - start) * (float(s) / steps)
+            p.position.x = xy[0]
+            p.position.y = xy[1]
+            waypoints.append(p)
+        return waypoints
+
+    def build(self, move_group, home_robot_state):
+        # Returns False if interrupted by shutdown, the lattice is then incomplete
+        rospy.loginfo("Building push lattice (%d nodes)", self.node_index.size)
+        self.nodes = []
+        self.node_index[:] = -1
+
+        for c in range(len(self.corners)):
+            for h in range(self.num_headings):
+                for r in range(len(self.radii)):
+                    if rospy.is_shutdown():
+                        move_group.set_start_state_to_current_state()
+                        return False
+                    start_pose = self.push_pose(self.start_xy[c, h, r], self.headings[c, h])
+
+                    # Home -> start of push
+                    move_group.set_start_state(home_robot_state)
+                    move_group.set_pose_target(start_pose)
+                    approach_plan = move_group.plan()
+                    move_group.clear_pose_targets()
+                    if not approach_plan.joint_trajectory.points:
+                        continue
+
+                    # Start of push -> corner, from the joint state the approach ends in
+                    end_state = RobotState()
+                    end_state.joint_state = JointState()
+                    end_state.joint_state.header = Header()
+                    end_state.joint_state.name = list(approach_plan.joint_trajectory.joint_names) or JOINT_NAMES
+                    end_state.joint_state.position = list(approach_plan.joint_trajectory.points[-1].positions)
+                    move_group.set_start_state(end_state)
+                    waypoints = self.push_waypoints(start_pose, self.corners[c], self.headings[c, h])
+                    push_plan, fraction = move_group.compute_cartesian_path(waypoints, self.push_dist, 0.0)
+                    if fraction < 0.99:
+                        continue
+
+                    self.node_index[c, h, r] = len(self.nodes)
+                    self.nodes.append({
+                        'corner': c,
+                        'heading': h,
+                        'radius': r,
+                        'pose': start_pose,
+                        'approach_plan': approach_plan,
+                        'push_plan': push_plan,
+                    })
+
+        move_group.set_start_state_to_current_state()
+        rospy.loginfo("Push lattice built, %d/%d valid nodes", len(self.nodes), self.node_index.size)
+        return True
+
+    def save(self, path):
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            pickle.dump({'nodes': self.nodes, 'node_index': self.node_index}, f, protocol=2)
+
+    def load(self, path):
+        with open(path, 'rb') as f:
+            cache = pickle.load(f)
+        self.nodes = cache['nodes']
+        self.node_index = cache['node_index']
+
+    def load_or_build(self, move_group, home_robot_state, home_joints):
+        path = self.cache_path(home_joints)
+        if os.path.exists(path):
+            self.load(path)
+            rospy.loginfo("Loaded push lattice from %s", path)
+        elif self.build(move_group, home_robot_state):
+            self.save(path)
+            rospy.loginfo("Saved push lattice to %s", path)
+        else:
+            # A partial lattice would be loaded by every later run and never rebuilt
+            rospy.logwarn("Push lattice build interrupted, not saved")
+
+    def nearest_corner(self, xy):
+        return int(np.argmin(np.linalg.norm(self.corners - np.asarray(xy), axis=1)))
+
+    def nearest_node(self, xy, corner=None, grasp=None, tolerance=NODE_TOLERANCE):
+        # Closest valid start point around corner (default the nearest one) within tolerance of xy, None if there is none.
+        # With grasp [x,y] given only nodes on the far side of the object from the corner count, so the push goes
+        # through the object instead of starting between it and the corner.
+        c = self.nearest_corner(xy) if corner is None else corner
+        dist = np.linalg.norm(self.start_xy[c] - np.asarray(xy), axis=2)
+        dist[self.node_index[c] < 0] = np.inf
+        if grasp is not None:
+            grasp = np.asarray(grasp)
+            behind = np.dot(self.start_xy[c] - grasp, grasp - self.corners[c]) > 0
+            dist[~behind] = np.inf
+        h, r = np.unravel_index(np.argmin(dist), dist.shape)
+        if dist[h, r] > tolerance:
+            return None
+        return self.nodes[self.node_index[c, h, r]]
@@ -0,0 +1,101 @@
+import threading
+import timeit
+import queue
+import rosbag
+
+# Sets of messages waiting to be written, about half a second at 60 fps
+QUEUE_LENGTH = 32
+# How long a full queue may hold up the capture loop before the set is dropped, s
+MAX_WAIT = 0.01
+# Bag chunk size before compression, bigger chunks compress better and mean fewer index entries
+CHUNK_THRESHOLD = 4 * 1024 * 1024
+# How often close() checks that the writer thread is still there while waiting for room in the queue, s
+CLOSE_POLL = 0.1
+
+
+class BagWriter:
+    # Writes a rosbag from its own thread, so disk stalls don't hold up the sensor reads.
+    # The capture loop hands over whole sets of messages (everything recorded for one time step) through a bounded
+    # queue. When the writer falls behind the queue fills up and write_set() waits up to max_wait for room, after
+    # that the set is dropped and counted, so memory stays bounded and a set is always written or dropped whole.
+    # Chunks are LZ4 compressed. close() writes out everything still queued, then closes the bag.
+    # A failed write (disk full, a message that doesn't serialise) stops the writer thread, the error is raised from
+    # the next write_set() or from close().
+    def __init__(self, path, max_queue=QUEUE_LENGTH, max_wait=MAX_WAIT, compression=rosbag.Compression.LZ4,
+                 chunk_threshold=CHUNK_THRESHOLD):
+        self.path = path
+        self.bag = rosbag.Bag(path, "w", compression=compression, chunk_threshold=chunk_threshold)
+        self.queue = queue.Queue(max_queue)
+        self.max_wait = max_wait
+
+        self.written = 0
+        self.dropped = 0
+        self.waited = 0  # sets that had to wait for room
+        self.max_depth = 0
+        self.write_time = 0.0
+        self.error = None
+        self.error_raised = False
+
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, topic, msg, t=None):
+        # A single message straight away, e.g. the metadata at the start
+        return self.write_set([(topic, msg, t)])
+
+    def write_set(self, messages):
+        # messages is [(topic, msg, t)], t the record time (rospy.Time), returns False if the set was dropped
+        self.raise_error()
+        try:
+            self.queue.put_nowait(messages)
+        except queue.Full:
+            self.waited += 1
+            try:
+                self.queue.put(messages, timeout=self.max_wait)
+            except queue.Full:
+                self.dropped += 1
+                return False
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+        return True
+
+    def run(self):
+        while True:
+            messages = self.queue.get()
+            if messages is None:
+                return
+            t1 = timeit.default_timer()
+            try:
+                for topic, msg, t in messages:
+                    self.bag.write(topic, msg, t)
+            except Exception as e:
+                self.error = e
+                return
+            self.write_time += timeit.default_timer() - t1
+            self.written += 1
+
+    def raise_error(self):
+        # Once only, so close() after a failed write_set() doesn't raise the same error again
+        if self.error is not None and not self.error_raised:
+            self.error_raised = True
+            raise self.error
+
+    def close(self):
+        # Blocks until everything queued is written, then raises the write error if there was one
+        while self.thread.is_alive():
+            try:
+                self.queue.put(None, timeout=CLOSE_POLL)
+                break
+            except queue.Full:
+                # Still writing, or stopped on an error and nothing will take it, the loop checks which
+                continue
+        self.thread.join()
+        try:
+            self.bag.close()
+        finally:
+            self.raise_error()
+
+    def summary(self):
+        return "%s: %d sets written, %d dropped, %d waited for room, queue depth max %d/%d, write ms mean %.2f%s" % (
+            self.path, self.written, self.dropped, self.waited, self.max_depth, self.queue.maxsize,
+            self.write_time / max(self.written, 1) * 1e3, "" if self.error is None else ", failed: %r" % self.error)
@@ -2,9 +2,7 @@
 
 from this import d
 import cv2
-import depthai as dai
 import rospy
-import rosbag
 from sensor_msgs.msg import Image
 from std_msgs.msg import Bool, Header
 from papillarray_ros_v2.msg import SensorState
@@ -15,6 +13,9 @@ from cv_bridge import CvBridge
 from digit_interface import Digit
 
 from grasp_executor.msg import DataCollectState
+from camera.frame_ring import FrameRing
+from rotation_measurement.data_collection.bag_writer import BagWriter
+from rotation_measurement.data_processing.image_codec import ImageEncoder
 
 class DataBagger:
     def __init__(self):
@@ -26,6 +27,8 @@ class DataBagger:
         self.image_topic = "/realsense/rgb"
         self.current_image = 0
         self.collect_data_flag = False
+        # raw, jpeg or png, see image_codec.py
+        self.image_format = rospy.get_param("~image_format", "raw")
         self.collection_info = None
         # self.image_sub = rospy.Subscriber(self.image_topic, Image, self.image_callback)
         self.collection_flag_sub = rospy.Subscriber('/collect_data', DataCollectState, self.collect_flag_callback)  ##TODO
@@ -49,36 +52,14 @@ class DataBagger:
             d1.set_fps(Digit.STREAMS["QVGA"]["fps"]["60fps"])
 
         bridge = CvBridge()
-
-        pipeline = dai.Pipeline()
-
-        # Define source and output
-        camRgb = pipeline.create(dai.node.ColorCamera)
-        xoutRgb = pipeline.create(dai.node.XLinkOut)
-
-        xoutRgb.setStreamName("rgb")
-
-        # Properties
-        camRgb.setPreviewSize(300, 300)
-        camRgb.setInterleaved(False)
-        camRgb.setColorOrder(dai.ColorCameraProperties.ColorOrder.RGB)
-        camRgb.setFps(60)
+        encoder = ImageEncoder(self.image_format, bridge=bridge)
 
         # Linking
         prev_0 = 0
         prev_1 = 0
 
-        camRgb.preview.link(xoutRgb.input)
-
-        # Connect to device and start pipeline
-        with dai.Device(pipeline) as device:
-
-            print('Connected cameras: ', device.getConnectedCameras())
-            # Print out usb speed
-            print('Usb speed: ', device.getUsbSpeed().name)
-
-            # Output queue will be used to get the rgb frames from the output defined above
-            qRgb = device.getOutputQueue(name="rgb", maxSize=1, blocking=False)
+        # Frames come from the camera server (camera/camera_server.py), which owns the OAK device
+        with FrameRing() as ring:
             t1 = timeit.default_timer()
 
 
@@ -97,15 +78,19 @@ class DataBagger:
                     try:
                         ##init a bag
                         # rospy.loginfo('reached try statement')
-                        bag = rosbag.Bag('./recorded_data_bags/data_'+str(int(math.floor(time.time())))+".bag", 'w') 
+                        # Written from its own thread, LZ4 compressed
+                        bag = BagWriter('./recorded_data_bags/data_'+str(int(math.floor(time.time())))+".bag")
                         bag.write('metadata', self.collection_info)
+                        # Start from the next frame, not what is left in the ring from before
+                        frame_no = ring.count()
                         
                         while self.collect_data_flag:
 
                             t2 = timeit.default_timer()
                             print(1 / (t2 - t1))
                             t1 = timeit.default_timer()
-                            inRgb = qRgb.get().getCvFrame()  # blocking call, will wait until a new data has arrived
+                            # blocking call, waits for the next frame, in order so the bag gets every frame
+                            frame_no, _, capture_wall_time, inRgb = ring.next(frame_no, newest=False)
 
                             if not self.use_papilarray:
                                 d0frame = d0.get_frame()
@@ -115,13 +100,13 @@ class DataBagger:
                                 # cv2.imshow("d1frame", d0frame)
 
 
-                                d0msg = bridge.cv2_to_imgmsg(d0frame)
-                                d1msg = bridge.cv2_to_imgmsg(d1frame)
+                                d0msg = encoder.encode(d0frame)
+                                d1msg = encoder.encode(d1frame)
 
-                            time_now = rospy.Time.from_sec(time.time())
+                            time_now = rospy.Time.from_sec(capture_wall_time)
                             header = Header()
                             header.stamp = time_now
-                            cv_image = bridge.cv2_to_imgmsg(inRgb)
+                            cv_image = encoder.encode(inRgb)
                             
                             # cv2.imshow("angle", inRgb)
                             # cv2.waitKey(1)
@@ -136,15 +121,14 @@ class DataBagger:
                                 prev_0 = self.tactile_data_0[0]
                                 prev_1 = self.tactile_data_1[0]
 
-                            bag.write('time', header)
-                            bag.write('image', cv_image) #Save an image
+                            # Everything for this time step goes to the bag writer as one set, recorded at the capture time
+                            messages = [('time', header), ('image', cv_image)] #Save an image
 
                             if self.use_papilarray:
-                                bag.write('tactile_0', self.tactile_data_0[1]) #save forces
-                                bag.write('tactile_1', self.tactile_data_1[1])
+                                messages += [('tactile_0', self.tactile_data_0[1]), ('tactile_1', self.tactile_data_1[1])] #save forces
                             else:
-                                bag.write('digit_0', d0msg)
-                                bag.write('digit_1', d1msg)
+                                messages += [('digit_0', d0msg), ('digit_1', d1msg)]
+                            bag.write_set([(topic, msg, time_now) for topic, msg in messages])
 
                             # cv2.imshow("rgb", inRgb)
 
@@ -154,8 +138,10 @@ class DataBagger:
                         ##once done, save bag
                     finally:
                         if bag is not None:
+                            # Writes out whatever is still queued
                             bag.close()
                             rospy.loginfo("Data collection ended")
+                            rospy.loginfo(bag.summary())
                         else: 
                             rospy.loginfo("??????")
 
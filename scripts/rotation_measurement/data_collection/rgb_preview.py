@@ -1,9 +1,7 @@
 #!/usr/bin/env python3
 
 import cv2
-import depthai as dai
 import rospy
-import rosbag
 from sensor_msgs.msg import Image
 from std_msgs.msg import Bool, Header
 from papillarray_ros_v2.msg import SensorState
@@ -14,6 +12,9 @@ from cv_bridge import CvBridge
 
 
 from grasp_executor.msg import DataCollectState
+from camera.frame_ring import FrameRing
+from rotation_measurement.data_collection.bag_writer import BagWriter
+from rotation_measurement.data_processing.image_codec import ImageEncoder
 
 class DataBagger:
     def __init__(self):
@@ -22,6 +23,8 @@ class DataBagger:
         self.image_topic = "/realsense/rgb"
         self.current_image = 0
         self.collect_data_flag = False
+        # raw, jpeg or png, see image_codec.py
+        self.image_format = rospy.get_param("~image_format", "raw")
         self.collection_info = None
         # self.image_sub = rospy.Subscriber(self.image_topic, Image, self.image_callback)
         self.collection_flag_sub = rospy.Subscriber('/collect_data', DataCollectState, self.collect_flag_callback)  ##TODO
@@ -34,48 +37,15 @@ class DataBagger:
         self.tactile_1_sub = rospy.Subscriber('/hub_0/sensor_1', SensorState, self.sensor_1_callback)
 
         bridge = CvBridge()
-
-        pipeline = dai.Pipeline()
-
-        # Define source and output
-        camRgb = pipeline.create(dai.node.ColorCamera)
-        xoutRgb = pipeline.create(dai.node.XLinkOut)
-        controlIn = pipeline.create(dai.node.XLinkIn)
-
-        controlIn.setStreamName('control')
-        controlIn.out.link(camRgb.inputControl)
-
-        xoutRgb.setStreamName("rgb")
-
-        # Properties
-        camRgb.setPreviewSize(300, 300)
-        camRgb.setInterleaved(False)
-        camRgb.setColorOrder(dai.ColorCameraProperties.ColorOrder.RGB)
-        camRgb.setFps(60)
-
-
+        encoder = ImageEncoder(self.image_format, bridge=bridge)
 
         # Linking
         prev_0 = 0
         prev_1 = 0
 
-        camRgb.preview.link(xoutRgb.input)
-
-        # Connect to device and start pipeline
-        with dai.Device(pipeline) as device:
-
-            print('Connected cameras: ', device.getConnectedCameras())
-            # Print out usb speed
-            print('Usb speed: ', device.getUsbSpeed().name)
-
-            controlQueue = device.getInputQueue('control')
-            ctrl = dai.CameraControl()
-            ctrl.setManualFocus(132)
-            controlQueue.send(ctrl)
-
-
-            # Output queue will be used to get the rgb frames from the output defined above
-            qRgb = device.getOutputQueue(name="rgb", maxSize=1, blocking=False)
+        # Frames come from the camera server (camera/camera_server.py), which owns the OAK device
+        # Manual focus 132 is set there, run it with _focus:=132
+        with FrameRing() as ring:
             t1 = timeit.default_timer()
 
 
@@ -95,20 +65,24 @@ class DataBagger:
                     try:
                         ##init a bag
                         # rospy.loginfo('reached try statement')
-                        bag = rosbag.Bag('./recorded_data_bags/data_'+str(int(math.floor(time.time())))+".bag", 'w') 
+                        # Written from its own thread, LZ4 compressed
+                        bag = BagWriter('./recorded_data_bags/data_'+str(int(math.floor(time.time())))+".bag")
                         bag.write('metadata', self.collection_info)
+                        # Start from the next frame, not what is left in the ring from before
+                        frame_no = ring.count()
                         
                         while self.collect_data_flag:
 
                             t2 = timeit.default_timer()
                             print(1 / (t2 - t1))
                             t1 = timeit.default_timer()
-                            inRgb = qRgb.get().getCvFrame()  # blocking call, will wait until a new data has arrived
+                            # blocking call, waits for the next frame, in order so the bag gets every frame
+                            frame_no, _, capture_wall_time, inRgb = ring.next(frame_no, newest=False)
 
-                            time_now = rospy.Time.from_sec(time.time())
+                            time_now = rospy.Time.from_sec(capture_wall_time)
                             header = Header()
                             header.stamp = time_now
-                            cv_image = bridge.cv2_to_imgmsg(inRgb)
+                            cv_image = encoder.encode(inRgb)
                             
                             if prev_0 == self.tactile_data_0[0]:
                                 print("uh oh repeated data")
@@ -119,10 +93,10 @@ class DataBagger:
                             prev_0 = self.tactile_data_0[0]
                             prev_1 = self.tactile_data_1[0]
 
-                            bag.write('time', header)
-                            bag.write('image', cv_image) #Save an image
-                            bag.write('tactile_0', self.tactile_data_0[1]) #save forces
-                            bag.write('tactile_1', self.tactile_data_1[1])
+                            # Everything for this time step goes to the bag writer as one set, recorded at the capture time
+                            messages = [('time', header), ('image', cv_image)] #Save an image
+                            messages += [('tactile_0', self.tactile_data_0[1]), ('tactile_1', self.tactile_data_1[1])] #save forces
+                            bag.write_set([(topic, msg, time_now) for topic, msg in messages])
 
                             # cv2.imshow("rgb", inRgb)
 
@@ -132,8 +106,10 @@ class DataBagger:
                         ##once done, save bag
                     finally:
                         if bag is not None:
+                            # Writes out whatever is still queued
                             bag.close()
                             rospy.loginfo("Data collection ended")
+                            rospy.loginfo(bag.summary())
                         else: 
                             rospy.loginfo("??????")
 
@@ -67,21 +67,24 @@ class DataBagger:
 
             # Output queue will be used to get the rgb frames from the output defined above
             qRgb = device.getOutputQueue(name="rgb", maxSize=4, blocking=False)
+
+            # Dictionary, parameters and intrinsics don't change between frames
+            arucoDict = cv2.aruco.Dictionary_get(cv2.aruco.DICT_4X4_100)
+            arucoParams = cv2.aruco.DetectorParameters_create()
+            cameraMatrix = np.array(matrix[0])
+            distCoeffs = np.array(dCoeff[:-2])
+
             while True:
                 inRgb = qRgb.get().getCvFrame()  # blocking call, will wait until a new data has arrived
 
-                arucoDict = cv2.aruco.Dictionary_get(cv2.aruco.DICT_4X4_100)
-
-                arucoParams = cv2.aruco.DetectorParameters_create()
                 (corners, ids, rejected_img_points) = cv2.aruco.detectMarkers(inRgb, arucoDict,
                     parameters=arucoParams)
                 cv2.aruco.drawDetectedMarkers(inRgb, corners, ids)
 
-                corners, ids, rejectedImgPoints = cv2.aruco.detectMarkers(inRgb, arucoDict)
                 # print(matrix[0])
-                rvec, tvec, x = cv2.aruco.estimatePoseSingleMarkers(corners, 0.05, np.array(matrix[0]), np.array(dCoeff[:-2]))
+                rvec, tvec, x = cv2.aruco.estimatePoseSingleMarkers(corners, 0.05, cameraMatrix, distCoeffs)
                 if rvec is not None and len(rvec) > 0:
-                    cv2.aruco.drawAxis(inRgb, np.array(matrix[0]), np.array(dCoeff[:-2]), rvec[0], tvec[0], 0.1)
+                    cv2.aruco.drawAxis(inRgb, cameraMatrix, distCoeffs, rvec[0], tvec[0], 0.1)
                     r_mat, _ = cv2.Rodrigues(rvec)
                     rotation = R.from_matrix(r_mat)
                     print("rotation", rotation.as_euler("xyz", degrees=True))
@@ -0,0 +1,98 @@
+import numpy as np
+
+
+def wrap_angle(angle):
+    # To [-180, 180) deg
+    return (angle + 180.0) % 360.0 - 180.0
+
+
+class AngleKalman:
+    # Constant velocity Kalman filter over x = (angle deg, angular velocity deg/s), driven by capture times.
+    # The state and covariance live in preallocated arrays and are updated in place with the closed form
+    # 2x2 expressions, so a frame costs a few float operations and allocates no arrays.
+    def __init__(self, accel_noise=3000.0, measurement_noise=1.0, gate=16.0, max_rejections=5, init_velocity_var=1e4):
+        # White noise angular acceleration spectral density, deg^2/s^3
+        self.q = accel_noise
+        # Angle measurement variance, deg^2 (blob centres are whole pixels)
+        self.r = measurement_noise
+        # Squared Mahalanobis distance above which a measurement is rejected (16 = 4 sigma)
+        self.gate = gate
+        # After this many rejections in a row the filter restarts from the measurement
+        self.max_rejections = max_rejections
+        self.init_velocity_var = init_velocity_var
+
+        self.x = np.zeros(2)
+        self.P = np.zeros((2, 2))
+        self.reset()
+
+    def reset(self):
+        self.initialised = False
+        self.stamp = None
+        self.rejections = 0
+        self.rejected = 0
+        self.last_distance = 0.0
+
+    def start(self, angle, stamp):
+        self.x[0] = angle
+        self.x[1] = 0.0
+        self.P[0, 0] = self.r
+        self.P[0, 1] = self.P[1, 0] = 0.0
+        self.P[1, 1] = self.init_velocity_var
+        self.stamp = stamp
+        self.rejections = 0
+        self.initialised = True
+
+    def predict(self, stamp):
+        # Moves the state forward to stamp
+        dt = stamp - self.stamp
+        if dt <= 0:
+            return
+        P = self.P
+        self.x[0] = wrap_angle(self.x[0] + dt * self.x[1])
+        p01 = P[0, 1] + dt * P[1, 1]
+        P[0, 0] += dt * (2 * P[0, 1] + dt * P[1, 1]) + self.q * dt ** 3 / 3
+        P[0, 1] = P[1, 0] = p01 + self.q * dt ** 2 / 2
+        P[1, 1] += self.q * dt
+        self.stamp = stamp
+
+    def update(self, angle, stamp):
+        # Adds a measured angle taken at stamp (s). Returns False if it was gated out as an outlier.
+        if not self.initialised:
+            self.start(angle, stamp)
+            return True
+
+        self.predict(stamp)
+        P = self.P
+        innovation = wrap_angle(angle - self.x[0])
+        s = P[0, 0] + self.r
+        self.last_distance = innovation * innovation / s
+
+        if self.last_distance > self.gate:
+            self.rejected += 1
+            self.rejections += 1
+            if self.rejections > self.max_rejections:
+                # Consistently far off, the track is lost rather than the measurements being wrong
+                self.start(angle, stamp)
+            return False
+        self.rejections = 0
+
+        k0 = P[0, 0] / s
+        k1 = P[0, 1] / s
+        self.x[0] = wrap_angle(self.x[0] + k0 * innovation)
+        self.x[1] += k1 * innovation
+        P[1, 1] -= k1 * P[0, 1]
+        P[0, 1] = P[1, 0] = (1 - k0) * P[0, 1]
+        P[0, 0] = (1 - k0) * P[0, 0]
+        return True
+
+    def extrapolate(self, stamp):
+        # Angle expected at stamp, without changing the state
+        return wrap_angle(self.x[0] + (stamp - self.stamp) * self.x[1])
+
+    @property
+    def angle(self):
+        return self.x[0]
+
+    @property
+    def velocity(self):
+        return self.x[1]
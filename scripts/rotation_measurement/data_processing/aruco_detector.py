@@ -0,0 +1,172 @@
+import timeit
+import numpy as np
+import cv2
+import yaml
+
+USE_ROS = True
+if USE_ROS:
+    from cv_bridge import CvBridge
+
+try:
+    from angle_filter import AngleKalman, wrap_angle
+except ImportError:
+    from rotation_measurement.data_processing.angle_filter import AngleKalman, wrap_angle
+
+ARUCO_DICT = cv2.aruco.DICT_4X4_100
+MARKER_LENGTH = 0.05  # m
+
+
+def load_intrinsics(path):
+    # (camera_matrix, dist_coeffs) from a calibration file in the camera_calibration / camera_info_manager YAML format
+    with open(path) as f:
+        calibration = yaml.safe_load(f)
+    camera_matrix = np.array(calibration["camera_matrix"]["data"], np.float64).reshape(3, 3)
+    dist_coeffs = np.array(calibration["distortion_coefficients"]["data"], np.float64)
+    return camera_matrix, dist_coeffs
+
+
+class ArucoAngleDetector:
+    # Rotation ground truth from a single ArUco marker, same interface as AngleDetector.
+    # The marker's own orientation makes the angle unambiguous over a full turn, so there is no quadrant tracking.
+    # Angles follow AngleDetector: deg in [-180, 180), counter clockwise on screen is positive, 0 when the marker is upright.
+    # With camera_matrix (and dist_coeffs) the angle comes from the marker pose, otherwise from its top edge in the image.
+    def __init__(self, cv2Image=False, camera_matrix=None, dist_coeffs=None, marker_length=MARKER_LENGTH,
+                 marker_id=None, useROI=True, useKalman=False, angle_offset=0.0):
+        if USE_ROS:
+            self.bridge = CvBridge()
+        self.cv2Image = cv2Image
+        self.marker_id = marker_id  # None takes the first marker found
+        self.angle_offset = angle_offset
+
+        # Built once, not per frame
+        dictionary = cv2.aruco.getPredefinedDictionary(ARUCO_DICT)
+        if hasattr(cv2.aruco, "ArucoDetector"):
+            # OpenCV >= 4.7
+            params = cv2.aruco.DetectorParameters()
+            params.cornerRefinementMethod = cv2.aruco.CORNER_REFINE_SUBPIX
+            detector = cv2.aruco.ArucoDetector(dictionary, params)
+            self.detect = lambda im: detector.detectMarkers(im)[:2]
+        else:
+            params = cv2.aruco.DetectorParameters_create()
+            params.cornerRefinementMethod = cv2.aruco.CORNER_REFINE_SUBPIX
+            self.detect = lambda im: cv2.aruco.detectMarkers(im, dictionary, parameters=params)[:2]
+
+        # Intrinsics are read once from the camera by the caller and reused for every frame
+        self.camera_matrix = None if camera_matrix is None else np.asarray(camera_matrix, np.float64).reshape(3, 3)
+        self.dist_coeffs = np.zeros(4) if dist_coeffs is None else np.asarray(dist_coeffs, np.float64).ravel()
+        half = marker_length / 2.0
+        # Marker corners in the order detectMarkers returns them, for SOLVEPNP_IPPE_SQUARE
+        self.object_points = np.array([[-half, half, 0], [half, half, 0], [half, -half, 0], [-half, -half, 0]], np.float64)
+
+        # Search only around the last marker, the whole frame when it isn't found there
+        self.useROI = useROI
+        self.roi_margin = 1.0  # marker sizes around the last marker
+        self.corners = None
+        self.roi_misses = 0
+
+        self.kalman = AngleKalman() if useKalman else None
+        self.reset_tracking()
+
+    def reset_tracking(self):
+        self.angle = None
+        self.prev_angle = None
+        self.calculatedAngle = None
+        self.largeChange = False
+        self.angular_velocity = 0
+        self.calc_time = None
+        self.corners = None
+        if self.kalman is not None:
+            self.kalman.reset()
+
+    def close(self):
+        pass
+
+    def getAngle(self):
+        if self.kalman is not None and self.kalman.initialised:
+            return self.kalman.angle
+        return self.angle
+
+    def getAngularVelocity(self):
+        if self.kalman is not None:
+            return self.kalman.velocity
+        return self.angular_velocity
+
+    def getCovariance(self):
+        return self.kalman.P
+
+    def predictAngle(self, stamp):
+        return self.kalman.extrapolate(stamp)
+
+    def roi_window(self, shape):
+        low = self.corners.min(axis=0)
+        high = self.corners.max(axis=0)
+        margin = self.roi_margin * (high - low).max()
+        x0, y0 = np.maximum(0, (low - margin).astype(int))
+        x1 = min(shape[1], int(high[0] + margin) + 1)
+        y1 = min(shape[0], int(high[1] + margin) + 1)
+        return x0, y0, x1, y1
+
+    def find_marker(self, im):
+        # 4x2 corners of the tracked marker, or None
+        corners, ids = self.detect(im)
+        if ids is None:
+            return None
+        for marker_corners, marker_id in zip(corners, ids.ravel()):
+            if self.marker_id is None or marker_id == self.marker_id:
+                return marker_corners.reshape(4, 2)
+        return None
+
+    def marker_angle(self, corners):
+        if self.camera_matrix is not None:
+            ok, rvec, _ = cv2.solvePnP(self.object_points, corners.astype(np.float64), self.camera_matrix,
+                                       self.dist_coeffs, flags=cv2.SOLVEPNP_IPPE_SQUARE)
+            if ok:
+                rotation, _ = cv2.Rodrigues(rvec)
+                # Marker x axis about the optical axis, camera y points down
+                return np.degrees(np.arctan2(-rotation[1, 0], rotation[0, 0]))
+        edge = corners[1] - corners[0]
+        return np.degrees(np.arctan2(-edge[1], edge[0]))
+
+    def update_angle(self, im, stamp=None):
+        if not self.cv2Image:
+            im = self.bridge.imgmsg_to_cv2(im, desired_encoding="8UC3")
+
+        corners = None
+        if self.useROI and self.corners is not None:
+            x0, y0, x1, y1 = self.roi_window(im.shape)
+            corners = self.find_marker(im[y0:y1, x0:x1])
+            if corners is None:
+                self.roi_misses += 1
+            else:
+                corners = corners + (x0, y0)
+        if corners is None:
+            corners = self.find_marker(im)
+        if corners is None:
+            self.corners = None
+            raise IndexError("no marker found")
+        self.corners = corners
+
+        self.prev_angle = self.angle
+        self.angle = float(wrap_angle(self.marker_angle(corners) - self.angle_offset))
+        self.calculatedAngle = self.angle
+
+        current_time = timeit.default_timer() if stamp is None else stamp
+        if self.kalman is not None:
+            self.kalman.update(self.angle, current_time)
+        elif self.calc_time is not None and current_time > self.calc_time:
+            new_angular_velocity = wrap_angle(self.angle - self.prev_angle) / (current_time - self.calc_time)
+            self.angular_velocity = 0.8 * new_angular_velocity + 0.2 * self.angular_velocity
+        self.calc_time = current_time
+
+        return self.calculatedAngle, self.largeChange
+
+    def track_batch(self, frames, stamps=None):
+        # Same as AngleDetector.track_batch, marker detection has nothing to share between frames
+        angles = np.full(len(frames), np.nan)
+        large_changes = np.zeros(len(frames), bool)
+        for i, frame in enumerate(frames):
+            try:
+                angles[i], large_changes[i] = self.update_angle(frame, None if stamps is None else stamps[i])
+            except IndexError:
+                pass
+        return angles, large_changes
@@ -0,0 +1,123 @@
+import cv2, glob, os, shutil, tempfile
+import timeit
+import numpy as np
+from blob_detector import AngleDetector
+from angle_filter import wrap_angle
+from synthetic_frames import rotation_sequence
+
+# Per frame latency of AngleDetector.update_angle in each detector mode on recorded frames,
+# then frame rate and angle error of each mode on synthetic rotations with known angles
+NUM_FRAMES = 600
+
+IMAGE_GLOB = "./wrote_ims/img_temp_*"
+FALLBACK_IMAGE = "./test_ims/img_temp.jpeg"
+
+HEADLESS = dict(writeImages=False, showImages=False, cv2Image=True, recordVideo=False)
+# The old default work: every frame's images written out and the visualisation recorded to video
+DEBUG = dict(HEADLESS, writeImages=True, recordVideo=True)
+MODES = [
+    ("debug", DEBUG),
+    ("headless", HEADLESS),
+    ("roi", dict(HEADLESS, useROI=True)),
+    ("lut", dict(HEADLESS, useLUT=True)),
+    ("roi+lut", dict(HEADLESS, useROI=True, useLUT=True)),
+    ("kalman", dict(HEADLESS, useROI=True, useLUT=True, useKalman=True)),
+    ("pyramid", dict(HEADLESS, useLUT=True, pyramidWidth=300)),
+    ("pyr+roi", dict(HEADLESS, useROI=True, useLUT=True, useKalman=True, pyramidWidth=300)),
+]
+
+# name, rotation_sequence arguments
+SEQUENCES = [
+    ("cw 90deg/s", dict(velocity=90.0)),
+    ("ccw 90deg/s", dict(velocity=-90.0, seed=1)),
+    ("cw 360deg/s blur", dict(velocity=360.0, turns=3, blur=5, noise=6.0, seed=2)),
+    # High resolution preview, 1200x1200
+    ("cw 180deg/s 4x", dict(velocity=180.0, turns=1, fps=30, blur=9, scale=4, seed=3)),
+]
+
+# Errors above this count as lost tracking
+LOST_ERROR = 10.0
+
+
+def load_frames():
+    paths = glob.glob(IMAGE_GLOB)
+    paths.sort(key=lambda x: int(x.split("_")[-1].split(".")[0]))
+    if not paths:
+        paths = [FALLBACK_IMAGE]
+    frames = [cv2.imread(p) for p in paths]
+    return [frames[i % len(frames)] for i in range(NUM_FRAMES)]
+
+
+def time_detector(AD, frames, stamps=None):
+    # Latency and reported angle per frame, nan where the blobs weren't found
+    times = np.zeros(len(frames))
+    angles = np.full(len(frames), np.nan)
+    for i, frame in enumerate(frames):
+        stamp = None if stamps is None else stamps[i]
+        t1 = timeit.default_timer()
+        try:
+            AD.update_angle(frame, stamp)
+            angles[i] = AD.getAngle()
+        except IndexError:
+            pass
+        times[i] = timeit.default_timer() - t1
+    return times, angles
+
+
+def run_mode(kwargs, frames, stamps=None):
+    if not (kwargs.get("writeImages") or kwargs.get("recordVideo")):
+        return time_detector(AngleDetector(**kwargs), frames, stamps)
+    # The detector writes images and video relative to the working directory, do that in a directory thrown away after
+    cwd = os.getcwd()
+    tmp = tempfile.mkdtemp()
+    os.mkdir(os.path.join(tmp, "wrote_ims"))
+    os.chdir(tmp)
+    try:
+        AD = AngleDetector(**kwargs)
+        try:
+            return time_detector(AD, frames, stamps)
+        finally:
+            AD.close()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmp)
+
+
+def run_batch(frames, stamps):
+    # track_batch over the whole sequence, time per frame is the average
+    AD = AngleDetector(**dict(HEADLESS, useLUT=True))
+    t1 = timeit.default_timer()
+    angles, _ = AD.track_batch(frames, stamps)
+    return np.full(len(frames), (timeit.default_timer() - t1) / len(frames)), angles
+
+
+def report(name, times):
+    print("%-10s mean %.3f ms  median %.3f ms  p99 %.3f ms  (%.0f fps)" % (
+        name, times.mean() * 1e3, np.median(times) * 1e3, np.percentile(times, 99) * 1e3, 1 / times.mean()))
+
+
+def report_accuracy(name, times, angles, truth):
+    error = np.abs(wrap_angle(angles - truth))
+    found = ~np.isnan(error)
+    lost = np.count_nonzero(~found) + np.count_nonzero(error[found] > LOST_ERROR)
+    if found.any():
+        print("%-10s %6.0f fps  error mean %.2f  p95 %.2f  max %.2f deg  lost %d/%d" % (
+            name, 1 / times.mean(), error[found].mean(), np.percentile(error[found], 95), error[found].max(), lost, len(error)))
+    else:
+        print("%-10s %6.0f fps  no blobs found" % (name, 1 / times.mean()))
+
+
+if __name__ == "__main__":
+    frames = load_frames()
+    print("recorded frames, latency")
+    for name, kwargs in MODES:
+        times, _ = run_mode(kwargs, frames)
+        report(name, times)
+
+    for sequence_name, sequence_args in SEQUENCES:
+        frames, truth, stamps = rotation_sequence(**sequence_args)
+        print("\nsynthetic %s, %d frames" % (sequence_name, len(frames)))
+        for name, kwargs in MODES:
+            times, angles = run_mode(kwargs, frames, stamps)
+            report_accuracy(name, times, angles, truth)
+        report_accuracy("batch", *run_batch(frames, stamps), truth=truth)
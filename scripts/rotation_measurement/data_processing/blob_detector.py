@@ -10,9 +10,24 @@ if USE_ROS:
     from std_msgs.msg import Empty as EmptyMsg
     from cv_bridge import CvBridge, CvBridgeError
     from std_srvs.srv import Empty, EmptyResponse
-    from grasp_executor.srv import AngleTrack
+    from grasp_executor.srv import AngleTrack, AngleTrackBatch, AngleTrackBatchResponse
+    from grasp_executor.msg import AngleState
 
 import matplotlib.pyplot as plt
+
+try:
+    from video_recorder import VideoRecorder
+except ImportError:
+    from rotation_measurement.data_processing.video_recorder import VideoRecorder
+try:
+    from angle_filter import AngleKalman, wrap_angle
+except ImportError:
+    from rotation_measurement.data_processing.angle_filter import AngleKalman, wrap_angle
+try:
+    from colour_lut import ColourLUT, RED_CLASS, ORANGE_CLASS
+except ImportError:
+    from rotation_measurement.data_processing.colour_lut import ColourLUT, RED_CLASS, ORANGE_CLASS
+import threading
 import timeit
 from time import sleep
 from enum import Enum
@@ -21,6 +36,18 @@ import sys
 
 PYTHON3 = sys.version_info.major == 3
 
+KERNEL = np.ones((2, 2), "uint8")
+
+# Orange tape, BGR
+ORANGE_LOWER = np.array([0, 12, 66])
+ORANGE_UPPER = np.array([49, 64, 203])
+
+# Red blobs, HSV (red hue wraps around 180)
+RED_LOWER_0 = np.array([0, 85, 0])
+RED_UPPER_0 = np.array([7, 255, 255])
+RED_LOWER_1 = np.array([175, 85, 0])
+RED_UPPER_1 = np.array([180, 255, 255])
+
 
 class Quadrant(Enum):
     INIT = 0
@@ -33,28 +60,93 @@ class Quadrant(Enum):
 class AngleDetectorService:
     def __init__(self):
         rospy.init_node("Angle_detector")
-        # self.image_topic = "/realsense/rgb"
+        # Streaming mode: every frame on ~image_topic is tracked and published on angle_state, e.g. "/realsense/rgb"
+        self.image_topic = rospy.get_param("~image_topic", "")
+
+        # ~detector: "blob" for the red blobs, "aruco" for a marker on the object
+        if rospy.get_param("~detector", "blob") == "aruco":
+            self.AD = self.aruco_detector()
+        else:
+            self.AD = AngleDetector(writeImages=False, showImages=False, cv2Image=False, recordVideo=rospy.get_param("~record_video", False))
+        # Services and the stream callback run on their own threads, the detector state is shared
+        self.lock = threading.Lock()
 
-        self.AD = AngleDetector(writeImages=False, showImages=False, cv2Image=False)
-        # self.current_image = None
-        # rospy.Subscriber(self.image_topic, Image, self.image_callback)
         rospy.Service("track_angle", AngleTrack, self.update_angle)
+        rospy.Service("track_angle_batch", AngleTrackBatch, self.update_angle_batch)
         rospy.Service("reset_angle_tracking", Empty, self.reset_tracking)
 
+        if self.image_topic:
+            self.angle_pub = rospy.Publisher("angle_state", AngleState, queue_size=10)
+            rospy.Subscriber("angle_state/reset", EmptyMsg, self.reset_callback)
+            # Only the newest frame is kept, a slow frame drops stale images instead of queueing them
+            rospy.Subscriber(self.image_topic, Image, self.image_callback, queue_size=1, buff_size=2 ** 24)
+
         rospy.loginfo("Angle tracker ready!")
         rospy.spin()
 
+    def aruco_detector(self):
+        # Imported here, cv2.aruco is only in OpenCV builds with contrib and the blob detector doesn't need it
+        try:
+            from aruco_detector import ArucoAngleDetector, load_intrinsics
+        except ImportError:
+            from rotation_measurement.data_processing.aruco_detector import ArucoAngleDetector, load_intrinsics
+
+        # Intrinsics of the tracked image size, from ~calibration_file (camera_calibration YAML) or
+        # ~camera_matrix (9 values, row major) and ~dist_coeffs. Without them the angle comes from the marker edge.
+        calibration_file = rospy.get_param("~calibration_file", "")
+        if calibration_file:
+            camera_matrix, dist_coeffs = load_intrinsics(calibration_file)
+        else:
+            camera_matrix = rospy.get_param("~camera_matrix", None)
+            dist_coeffs = rospy.get_param("~dist_coeffs", None)
+        if camera_matrix is None:
+            rospy.logwarn("No camera intrinsics given, marker angles come from the marker's top edge")
+
+        return ArucoAngleDetector(cv2Image=False, camera_matrix=camera_matrix, dist_coeffs=dist_coeffs,
+                                  marker_id=rospy.get_param("~marker_id", None))
+
     def update_angle(self, req):
         # print(dir(req))
-        return self.AD.update_angle(req.im)
+        with self.lock:
+            return self.AD.update_angle(req.im)
+
+    def update_angle_batch(self, req):
+        # A whole trial in one request, for offline labelling
+        if not req.ims:
+            return AngleTrackBatchResponse([], [])
+        with self.lock:
+            if req.reset:
+                self.AD.reset_tracking()
+            frames = np.stack([self.AD.bridge.imgmsg_to_cv2(im, desired_encoding="8UC3") for im in req.ims])
+            stamps = np.array([im.header.stamp.to_sec() for im in req.ims])
+            # Unstamped images fall back to evenly spaced frames
+            angles, large_changes = self.AD.track_batch(frames, stamps if stamps.all() else None)
+        return AngleTrackBatchResponse(angles.tolist(), large_changes.tolist())
+
+    def image_callback(self, msg):
+        stamp = msg.header.stamp
+        with self.lock:
+            # Velocity from capture times, not from when the frame got here
+            self.AD.update_angle(msg, None if stamp.is_zero() else stamp.to_sec())
+            state = AngleState()
+            state.header = msg.header
+            state.angle = self.AD.getAngle()
+            state.angular_velocity = self.AD.getAngularVelocity()
+            state.largeChange = self.AD.largeChange
+        self.angle_pub.publish(state)
 
     def reset_tracking(self, req):
-        self.AD.reset_tracking()
+        with self.lock:
+            self.AD.reset_tracking()
         return EmptyResponse()
 
+    def reset_callback(self, msg):
+        with self.lock:
+            self.AD.reset_tracking()
+
 
 class AngleDetector:
-    def __init__(self, writeImages=True, showImages=True, cv2Image=False):
+    def __init__(self, writeImages=False, showImages=False, cv2Image=False, recordVideo=False, useROI=False, useLUT=False, useKalman=False, pyramidWidth=None):
         if USE_ROS:
             self.bridge = CvBridge()
         self.state = Quadrant.INIT
@@ -68,16 +160,42 @@ class AngleDetector:
         self.writeImages = writeImages
         self.showImages = showImages
         self.cv2Image = cv2Image
+        # Visualisation is opt in. With no images shown, written or recorded, update_angle only computes the angle
+        # (no copies, no I/O)
+        self.recordVideo = recordVideo
+        self.visualize = writeImages or showImages or recordVideo
         self.count = 0
         self.videoNumber = 0
-        self.videoWriter = cv2.VideoWriter(
-            str(self.videoNumber) + ".avi",
-            cv2.VideoWriter_fourcc("M", "J", "P", "G"),
-            5,
-            (600, 300),
-        )
+        # Encoding happens on the recorder's thread, frames are dropped rather than stalling tracking
+        self.recorder = None
+        if self.recordVideo:
+            # Frame size follows the camera, canvas and frame side by side
+            self.recorder = VideoRecorder(str(self.videoNumber) + ".avi", fps=5)
         # self.videoWriter2 = cv2.VideoWriter("original" + str(self.videoNumber) + '.avi',cv2.VideoWriter_fourcc('M','J','P','G'), 60, (300,300))
 
+        # Region of interest tracking: once locked, only a window around the last two blobs is searched
+        self.useROI = useROI
+        self.roi_margin = 0.25  # blob sizes around the blobs at rest
+        self.frame_dt = 1.0 / 60  # expected time between frames
+        self.centers = None
+        self.blob_boxes = None  # bounding rects (x, y, w, h) of the last two blobs, full frame coordinates
+        self.roi_misses = 0
+
+        # Single table lookup segmentation, same masks as the HSV/BGR inRange path
+        self.lut = None
+        if useLUT:
+            self.lut = ColourLUT(
+                [(RED_CLASS, RED_LOWER_0, RED_UPPER_0), (RED_CLASS, RED_LOWER_1, RED_UPPER_1)],
+                [(ORANGE_CLASS, ORANGE_LOWER, ORANGE_UPPER)],
+            )
+
+        # Coarse to fine search for large frames: blobs are found on a copy about pyramidWidth px wide,
+        # then their centres are refined on full resolution crops. Frames narrower than 2 * pyramidWidth are searched directly.
+        self.pyramidWidth = pyramidWidth
+
+        # Filtered angle and velocity from capture times, replaces the raw angle and blended velocity in the getters
+        self.kalman = AngleKalman() if useKalman else None
+
     def reset_tracking(self):
         self.state = Quadrant.INIT
         self.closest_state = Quadrant.INIT
@@ -86,27 +204,44 @@ class AngleDetector:
         self.largeChange = False
         self.angular_velocity = 0
         self.calc_time = None
+        self.centers = None
+        self.blob_boxes = None
+        if self.kalman is not None:
+            self.kalman.reset()
         self.videoNumber += 1
-        self.videoWriter.release()
+        if self.recordVideo:
+            self.recorder.rollover(str(self.videoNumber) + ".avi")
         # self.videoWriter2.release()
 
-        self.videoWriter = cv2.VideoWriter(
-            str(self.videoNumber) + ".avi",
-            cv2.VideoWriter_fourcc("M", "J", "P", "G"),
-            5,
-            (600, 300),
-        )
         # self.videoWriter2 = cv2.VideoWriter("original" + str(self.videoNumber) + '.avi',cv2.VideoWriter_fourcc('M','J','P','G'), 60, (300,300))
 
         print("reset!")
 
+    def close(self):
+        # Flushes queued video frames
+        if self.recordVideo:
+            self.recorder.close()
+            print("video frames written: %d, dropped: %d" % (self.recorder.written_frames, self.recorder.dropped_frames))
+
     def getAngle(self):
+        if self.kalman is not None and self.kalman.initialised:
+            return self.kalman.angle
         return self.angle
 
     def getAngularVelocity(self):
+        if self.kalman is not None:
+            return self.kalman.velocity
         return self.angular_velocity
 
-    def angle_calculation(self, point0, point1):
+    def getCovariance(self):
+        # 2x2 covariance of (angle, angular velocity), only with useKalman
+        return self.kalman.P
+
+    def predictAngle(self, stamp):
+        # Angle extrapolated to stamp (same clock as the stamps given to update_angle), only with useKalman
+        return self.kalman.extrapolate(stamp)
+
+    def angle_calculation(self, point0, point1, current_time=None):
         if point0[0] - point1[0] == 0:
             temp_angle = 90
         else:
@@ -131,7 +266,7 @@ class AngleDetector:
 
         if self.prev_angle is None:
             self.angle = temp_angle
-        elif abs(temp_angle - self.prev_angle) > 20:
+        elif abs(wrap_angle(temp_angle - self.prev_angle)) > 20:
             # very large change
             self.largeChange = True
             pass
@@ -139,11 +274,15 @@ class AngleDetector:
             self.angle = temp_angle
 
         self.calculatedAngle = temp_angle
-        current_time = timeit.default_timer()
+        # Capture time if known, otherwise the time the frame is processed
+        if current_time is None:
+            current_time = timeit.default_timer()
 
-        if self.calc_time:
+        if self.kalman is not None:
+            self.kalman.update(temp_angle, current_time)
+        elif self.calc_time is not None:
             # print(self.angle, prev_angle, self.calc_time, current_time)
-            new_angular_velocity = (self.angle - self.prev_angle) / (
+            new_angular_velocity = wrap_angle(self.angle - self.prev_angle) / (
                 current_time - self.calc_time
             )
             self.angular_velocity = (
@@ -186,59 +325,17 @@ class AngleDetector:
         elif self.state == Quadrant.NE:
             self.closest_state = Quadrant.NW if self.angle > -135 else Quadrant.SE
 
-    def update_angle(self, im):
-        # print("Reached loop!")
-        # image = cv2.imread('img_temp.jpeg')
-        if not self.cv2Image:
-            im = self.bridge.imgmsg_to_cv2(im, desired_encoding="8UC3")
-
-        result = im.copy()
-        canvas = result.copy()
+    def colour_masks(self, im):
+        # Raw red and orange masks. Purely per pixel, so im can be several frames stacked along the rows.
+        if self.lut is not None:
+            classes = self.lut.classify(im)
+            return self.lut.mask(classes, RED_CLASS), self.lut.mask(classes, ORANGE_CLASS)
 
         image = cv2.cvtColor(im, cv2.COLOR_BGR2HSV)
+        rgb_mask = cv2.inRange(im, ORANGE_LOWER, ORANGE_UPPER)
 
-        kernel = np.ones((2, 2), "uint8")
-
-        lower = np.array([0, 12, 66])
-        upper = np.array([49, 64, 203])
-
-        rgb_mask = cv2.inRange(result, lower, upper)
-        rgb_mask = cv2.dilate(rgb_mask, kernel, iterations=1)
-
-        orange_mask = np.zeros(rgb_mask.shape)
-
-        orange_contours, _ = cv2.findContours(
-            rgb_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE
-        )
-        orange_contours = sorted(
-            orange_contours, key=lambda el: cv2.contourArea(el), reverse=True
-        )
-
-        for index, i in enumerate(orange_contours):
-
-            M = cv2.moments(i)
-            _, (width, height), _ = cv2.minAreaRect(i)
-            if width == 0 or height == 0:
-                ratio = ratio
-            else:
-                ratio = (width / height) if width > height else (height / width)
-            print("ratio", ratio)
-            if ratio < 4:
-                continue
-            center1 = (int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"]))
-            cv2.circle(canvas, center1, 2, (255, 255, 0), -1)
-            cv2.drawContours(orange_mask, orange_contours[index : index + 1], -1, 1, -1)
-            break
-
-        lower = np.array([0, 85, 0])
-        upper = np.array([7, 255, 255])
-        mask = cv2.inRange(image, lower, upper)
-
-        lower1 = np.array([175, 85, 0])
-        upper1 = np.array([180, 255, 255])
-        mask1 = cv2.inRange(image, lower1, upper1)
-
-
+        mask = cv2.inRange(image, RED_LOWER_0, RED_UPPER_0)
+        mask1 = cv2.inRange(image, RED_LOWER_1, RED_UPPER_1)
 
         # lower = np.array([0, 181, 75])
         # upper = np.array([0, 255, 112])
@@ -258,21 +355,241 @@ class AngleDetector:
 
         # (hMin = 0 , sMin = 62, vMin = 0), (hMax = 0 , sMax = 255, vMax = 85)
 
-        orange_mask = orange_mask.astype(np.uint8)
-        mask = cv2.subtract(mask + mask1, orange_mask * 255)
+        # Hue ranges don't overlap, so or-ing is the same as adding
+        cv2.bitwise_or(mask, mask1, dst=mask)
+        return mask, rgb_mask
+
+    def segment(self, im):
+        # Mask of the two red blobs with the orange tape removed, and the tape centre (None if not found)
+        mask, rgb_mask = self.colour_masks(im)
+        return self.remove_tape(mask, rgb_mask)
+
+    def remove_tape(self, mask, rgb_mask):
+        # Finds the orange tape (long thin orange contour) in a single frame and cuts it out of the red mask
+        rgb_mask = cv2.dilate(rgb_mask, KERNEL, iterations=1)
+
+        orange_mask = np.zeros(rgb_mask.shape, np.uint8)
+        orange_center = None
+
+        orange_contours = self.find_contours(rgb_mask)
+
+        for index, i in enumerate(orange_contours):
+            _, (width, height), _ = cv2.minAreaRect(i)
+            if width == 0 or height == 0:
+                continue
+            ratio = (width / height) if width > height else (height / width)
+            if ratio < 4:
+                continue
+            orange_center = self.contour_center(i)
+            cv2.drawContours(orange_mask, orange_contours[index : index + 1], -1, 255, -1)
+            break
+
+        cv2.subtract(mask, orange_mask, dst=mask)
         # mask = cv2.subtract(mask + mask1 + mask2 + mask3, orange_mask * 255)
         # # # # mask = mask + mask1 + mask2 + mask3
 
-        mask = cv2.dilate(mask, kernel, iterations=1)
+        mask = cv2.dilate(mask, KERNEL, iterations=1)
+
+        return mask, rgb_mask, orange_mask, orange_center
+
+    def find_contours(self, mask):
+        # External contours, largest first
+        if PYTHON3:
+            contours, _ = cv2.findContours(
+                mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE
+            )
+        else:
+            _, contours, _ = cv2.findContours(
+                mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE
+            )
+        return sorted(contours, key=lambda el: cv2.contourArea(el), reverse=True)
+
+    def contour_center(self, contour):
+        M = cv2.moments(contour)
+        return (int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"]))
+
+    def track(self, center1, center2, stamp=None):
+        # Quadrant state machine and angle from the two blob centres
+        if self.angle is None:
+            self.state_update(center1, center2)
+            self.angle_calculation(center1, center2, stamp)
+        else:
+            self.closest_new_state()
+            self.state_update(center1, center2)
+            self.angle_calculation(center1, center2, stamp)
+
+    def roi_window(self, shape):
+        # Box around the last two blobs, grown by a fraction of the blob size and by how far the blobs can move in a
+        # frame at the current speed. Sized from the blobs themselves, so it scales with the frame and the blob size.
+        boxes = np.array(self.blob_boxes)
+        x0, y0 = boxes[:, :2].min(axis=0)
+        x3, y3 = (boxes[:, :2] + boxes[:, 2:]).max(axis=0)
+        # No point of either blob is further than the box diagonal from the centre of rotation between them
+        reach = np.hypot(x3 - x0, y3 - y0)
+        travel = reach * abs(np.deg2rad(self.getAngularVelocity())) * self.frame_dt
+        margin = int(np.ceil(self.roi_margin * boxes[:, 2:].max() + 2 * travel))
+        return max(0, x0 - margin), max(0, y0 - margin), min(shape[1], x3 + margin), min(shape[0], y3 + margin)
+
+    def clipped(self, contours, window, shape):
+        # Whether either blob touches an edge of the window that isn't the edge of the frame, i.e. was cut off
+        x0, y0, x3, y3 = window
+        for x, y, w, h in (cv2.boundingRect(c) for c in contours[:2]):
+            if (x == 0 and x0 > 0) or (y == 0 and y0 > 0) or (x0 + x + w == x3 < shape[1]) or (y0 + y + h == y3 < shape[0]):
+                return True
+        return False
+
+    def blob_bounds(self, contours, offset=(0, 0)):
+        return [(x + offset[0], y + offset[1], w, h) for x, y, w, h in (cv2.boundingRect(c) for c in contours[:2])]
+
+    def pyramid_scale(self, shape):
+        if self.pyramidWidth is None:
+            return 1
+        return max(1, shape[1] // self.pyramidWidth)
+
+    def pyramid_search(self, im, scale):
+        # Segments a copy shrunk by scale, then re-segments a full resolution crop around each of the two largest
+        # candidates. Returns the coarse masks and the refined contours in full frame coordinates.
+        height, width = im.shape[:2]
+        small = cv2.resize(im, (width // scale, height // scale), interpolation=cv2.INTER_AREA)
+        mask, rgb_mask, orange_mask, orange_center = self.segment(small)
+        if orange_center is not None:
+            orange_center = (orange_center[0] * scale + scale // 2, orange_center[1] * scale + scale // 2)
+
+        contours = []
+        for candidate in self.find_contours(mask)[:2]:
+            x, y, w, h = cv2.boundingRect(candidate)
+            # Candidate bounding box plus a coarse pixel each side
+            cx0, cy0 = max(0, x - 1), max(0, y - 1)
+            cx1, cy1 = min(small.shape[1], x + w + 1), min(small.shape[0], y + h + 1)
+            # Only full resolution pixels under the (grown) coarse blob count, keeps out the tape and the other blob
+            region = np.zeros((cy1 - cy0, cx1 - cx0), np.uint8)
+            cv2.drawContours(region, [candidate], -1, 255, -1, offset=(-cx0, -cy0))
+            region = cv2.dilate(region, np.ones((3, 3), np.uint8))
+            region = cv2.resize(region, ((cx1 - cx0) * scale, (cy1 - cy0) * scale), interpolation=cv2.INTER_NEAREST)
+
+            x0, y0 = cx0 * scale, cy0 * scale
+            x1, y1 = min(width, cx1 * scale), min(height, cy1 * scale)
+            fine, _ = self.colour_masks(im[y0:y1, x0:x1])
+            cv2.bitwise_and(fine, region[: y1 - y0, : x1 - x0], dst=fine)
+            fine = cv2.dilate(fine, KERNEL, iterations=1)
+            fine_contours = self.find_contours(fine)
+            if fine_contours:
+                contours.append(fine_contours[0] + np.array([x0, y0]))
+            else:
+                # Nothing at full resolution (e.g. blurred away), fall back to the coarse contour
+                contours.append(candidate * scale + scale // 2)
+        return mask, rgb_mask, orange_mask, orange_center, contours
+
+    def update_angle(self, im, stamp=None):
+        # print("Reached loop!")
+        # image = cv2.imread('img_temp.jpeg')
+        if not self.cv2Image:
+            im = self.bridge.imgmsg_to_cv2(im, desired_encoding="8UC3")
+
+        window = None
+        contours = []
+        # Only once the speed is known (two frames tracked), the window grows with it
+        if self.useROI and self.blob_boxes is not None and self.prev_angle is not None:
+            window = self.roi_window(im.shape)
+            x0, y0, x3, y3 = window
+            # Slicing is a view, no copy of the frame
+            mask, rgb_mask, orange_mask, orange_center = self.segment(im[y0:y3, x0:x3])
+            contours = self.find_contours(mask)
+            if len(contours) < 2 or self.clipped(contours, window, im.shape):
+                # Lost the blobs or cut one off, search the whole frame
+                self.roi_misses += 1
+                window = None
+
+        scale = self.pyramid_scale(im.shape)
+        if window is None and scale > 1:
+            mask, rgb_mask, orange_mask, orange_center, contours = self.pyramid_search(im, scale)
+        elif window is None:
+            mask, rgb_mask, orange_mask, orange_center = self.segment(im)
+            contours = self.find_contours(mask)
+
+        center1 = self.contour_center(contours[0])
+        center2 = self.contour_center(contours[1])
+        if window is not None:
+            center1 = (center1[0] + window[0], center1[1] + window[1])
+            center2 = (center2[0] + window[0], center2[1] + window[1])
+        self.centers = (center1, center2)
+        self.blob_boxes = self.blob_bounds(contours, window[:2] if window is not None else (0, 0))
+
+        self.track(center1, center2, stamp)
+
+        if self.visualize:
+            self.draw(im, mask, rgb_mask, orange_mask, orange_center, contours, center1, center2, window)
+
+        return self.calculatedAngle, self.largeChange
 
-        result = cv2.bitwise_and(result, result, mask=mask)
+    def track_batch(self, frames, stamps=None, chunk=8):
+        # Angles of a whole trial, frames is a T x H x W x 3 uint8 array (BGR).
+        # Colour segmentation runs over chunks of frames at once, then the contours and the quadrant
+        # state machine run per frame on the masks. Returns the calculatedAngle and largeChange of every
+        # frame, as update_angle would have returned them one frame at a time (nan where the blobs weren't found).
+        # stamps are capture times in s for the angular velocity, by default frames are frame_dt apart.
+        # Tracking state carries over between calls, nothing is drawn or recorded.
+        frames = np.ascontiguousarray(frames)
+        num_frames, height, width = frames.shape[:3]
+        if stamps is None:
+            stamps = np.arange(num_frames) * self.frame_dt
+        angles = np.full(num_frames, np.nan)
+        large_changes = np.zeros(num_frames, bool)
+
+        for start in range(0, num_frames, chunk):
+            # Small chunks keep the masks in cache, larger ones are slower
+            block = frames[start : start + chunk]
+            # Stacking frames along the rows gives one image the colour conversions run over in a single call
+            red, orange = self.colour_masks(block.reshape(-1, width, 3))
+            red = red.reshape(-1, height, width)
+            orange = orange.reshape(-1, height, width)
+
+            for i in range(len(block)):
+                mask, _, _, _ = self.remove_tape(red[i], orange[i])
+                contours = self.find_contours(mask)
+                if len(contours) < 2:
+                    continue
+                center1 = self.contour_center(contours[0])
+                center2 = self.contour_center(contours[1])
+                self.centers = (center1, center2)
+                self.blob_boxes = self.blob_bounds(contours)
+                self.track(center1, center2, stamps[start + i])
+                angles[start + i] = self.calculatedAngle
+                large_changes[start + i] = self.largeChange
+
+        return angles, large_changes
+
+    def draw(self, im, mask, rgb_mask, orange_mask, orange_center, contours, center1, center2, window=None):
+        # Debug side channel: annotated frames to screen, disk and the video file
+        canvas = im.copy()
+        if window is not None:
+            # Back to full frame coordinates
+            x0, y0, x3, y3 = window
+            full = []
+            for m in (mask, rgb_mask, orange_mask):
+                f = np.zeros(im.shape[:2], np.uint8)
+                f[y0:y3, x0:x3] = m
+                full.append(f)
+            mask, rgb_mask, orange_mask = full
+            contours = [c + np.array([x0, y0]) for c in contours[:2]]
+            if orange_center is not None:
+                orange_center = (orange_center[0] + x0, orange_center[1] + y0)
+            cv2.rectangle(canvas, (x0, y0), (x3 - 1, y3 - 1), (255, 0, 0), 1)
+        elif mask.shape != im.shape[:2]:
+            # Coarse masks from the pyramid search
+            size = (im.shape[1], im.shape[0])
+            mask, rgb_mask, orange_mask = [cv2.resize(m, size, interpolation=cv2.INTER_NEAREST) for m in (mask, rgb_mask, orange_mask)]
+        if orange_center is not None:
+            cv2.circle(canvas, orange_center, 2, (255, 255, 0), -1)
+
+        result = cv2.bitwise_and(im, im, mask=mask)
 
         if self.showImages:
             cv2.imshow("orig", im)
-            cv2.imshow("hsv", image)
+            cv2.imshow("hsv", cv2.cvtColor(im, cv2.COLOR_BGR2HSV))
             cv2.imshow("mask", mask)
             cv2.imshow("rgb_mask", rgb_mask)
-            cv2.imshow("orange_mask", orange_mask * 255)
+            cv2.imshow("orange_mask", orange_mask)
             cv2.imshow("result", result)
 
             cv2.waitKey(1)
@@ -282,42 +599,10 @@ class AngleDetector:
             cv2.imwrite("./wrote_ims/mask_" + str(self.count) + ".jpeg", mask)
             cv2.imwrite("./wrote_ims/result_" + str(self.count) + ".jpeg", result)
 
-        contours = None
-        if PYTHON3:
-            # print(len(cv2.findContours(
-            #     mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE
-            # )))
-
-            contours, _ = cv2.findContours(
-                mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE
-            )
-            contours = sorted(
-                contours, key=lambda el: cv2.contourArea(el), reverse=True
-            )
-
-        else:
-            _, contours, _ = cv2.findContours(
-                mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE
-            )
-            contours.sort(key=lambda el: cv2.contourArea(el), reverse=True)
-
-        M = cv2.moments(contours[0])
-        center1 = (int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"]))
         cv2.circle(canvas, center1, 2, (0, 255, 0), -1)
-
-        M = cv2.moments(contours[1])
-        center2 = (int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"]))
         cv2.circle(canvas, center2, 2, (0, 255, 0), -1)
-
         cv2.drawContours(canvas, contours[:2], -1, (0, 255, 0), 3)
 
-        if self.angle is None:
-            self.state_update(center1, center2)
-            self.angle_calculation(center1, center2)
-        else:
-            self.closest_new_state()
-            self.state_update(center1, center2)
-            self.angle_calculation(center1, center2)
         # print(canvas.shape)
         # if self.showImages:
         # print("start")
@@ -329,20 +614,20 @@ class AngleDetector:
         # plt.show()
         # print("help")
 
-        vis = np.concatenate((canvas, im), axis=1)
-        if self.angle is not None and self.prev_angle is not None:
-            cv2.putText(
-                vis,
-                f"prev angle: {self.prev_angle:.2f}, current: {self.angle:.2f}, delta: {(self.angle - self.prev_angle):.2f}",
-                (20, 20),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.4,
-                (0, 255, 0),
-                1,
-            )
+        if self.recordVideo:
+            vis = np.concatenate((canvas, im), axis=1)
+            if self.angle is not None and self.prev_angle is not None:
+                cv2.putText(
+                    vis,
+                    f"prev angle: {self.prev_angle:.2f}, current: {self.angle:.2f}, delta: {(self.angle - self.prev_angle):.2f}",
+                    (20, 20),
+                    cv2.FONT_HERSHEY_SIMPLEX,
+                    0.4,
+                    (0, 255, 0),
+                    1,
+                )
 
-        print(vis.shape)
-        self.videoWriter.write(vis)
+            self.recorder.write(vis)
 
         if self.writeImages:
             cv2.imwrite("./wrote_ims/canvas_" + str(self.count) + ".jpeg", canvas)
@@ -350,8 +635,6 @@ class AngleDetector:
             cv2.imshow("canvas", canvas)
             cv2.waitKey(1)
         # self.count += 1
-        print(self.angle)
-        return self.calculatedAngle, self.largeChange
 
 
 if __name__ == "__main__":
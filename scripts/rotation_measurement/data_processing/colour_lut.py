@@ -0,0 +1,81 @@
+import hashlib
+import os
+import numpy as np
+import cv2
+
+LUT_CACHE_DIR = os.path.expanduser("~/.ros/grasp_executor")
+
+# Class bits, a colour can be in more than one class
+RED_CLASS = 1
+ORANGE_CLASS = 2
+
+
+class ColourLUT:
+    # BGR -> class lookup table over all 2^24 colours, built once from the HSV/BGR threshold ranges.
+    # A frame is classified with one table lookup instead of cvtColor + an inRange per range.
+    # hsv_ranges and bgr_ranges are lists of (class_bit, lower, upper), bounds inclusive as in cv2.inRange.
+    def __init__(self, hsv_ranges, bgr_ranges, cache_dir=LUT_CACHE_DIR):
+        self.hsv_ranges = hsv_ranges
+        self.bgr_ranges = bgr_ranges
+        self.cache_dir = cache_dir
+
+        # Tables are cached per set of thresholds, the key changes whenever a range does
+        key = repr([
+            (space, int(class_bit), [int(v) for v in lower], [int(v) for v in upper])
+            for space, ranges in (("hsv", hsv_ranges), ("bgr", bgr_ranges))
+            for class_bit, lower, upper in ranges
+        ])
+        key = hashlib.md5(key.encode("utf-8")).hexdigest()
+        self.path = os.path.join(cache_dir, "colour_lut_" + key + ".npy")
+
+        self.table = self.load_or_build()
+
+        # Reused between frames of the same size
+        self.bgra = None
+        self.classes = None
+
+    def load_or_build(self):
+        if os.path.exists(self.path):
+            table = np.load(self.path)
+            if table.shape == (1 << 24,):
+                return table
+        table = self.build()
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        # Written under a temporary name so a half written table is never loaded
+        tmp_path = self.path + ".tmp.npy"
+        np.save(tmp_path, table)
+        os.rename(tmp_path, self.path)
+        return table
+
+    def build(self):
+        # Every colour as one 4096x4096 image, index = B | G << 8 | R << 16 (see classify)
+        index = np.arange(1 << 24, dtype=np.uint32).reshape(4096, 4096)
+        colours = np.empty((4096, 4096, 3), np.uint8)
+        colours[..., 0] = index & 0xFF
+        colours[..., 1] = (index >> 8) & 0xFF
+        colours[..., 2] = index >> 16
+
+        table = np.zeros((4096, 4096), np.uint8)
+        if self.hsv_ranges:
+            hsv = cv2.cvtColor(colours, cv2.COLOR_BGR2HSV)
+            for class_bit, lower, upper in self.hsv_ranges:
+                table |= cv2.inRange(hsv, np.asarray(lower), np.asarray(upper)) & class_bit
+        for class_bit, lower, upper in self.bgr_ranges:
+            table |= cv2.inRange(colours, np.asarray(lower), np.asarray(upper)) & class_bit
+        return table.reshape(-1)
+
+    def classify(self, im):
+        # Per pixel class bits of a BGR frame. The result is overwritten by the next call.
+        if self.classes is None or self.classes.shape != im.shape[:2]:
+            self.bgra = np.empty(im.shape[:2] + (4,), np.uint8)
+            self.classes = np.empty(im.shape[:2], np.uint8)
+        # With alpha zeroed each BGRA pixel read as a little endian uint32 is its table index
+        cv2.cvtColor(im, cv2.COLOR_BGR2BGRA, dst=self.bgra)
+        self.bgra[..., 3] = 0
+        np.take(self.table, self.bgra.view(np.uint32)[..., 0], out=self.classes)
+        return self.classes
+
+    def mask(self, classes, class_bit):
+        # 0/255 mask of the pixels in class_bit, same as the cv2.inRange output
+        return cv2.compare(cv2.bitwise_and(classes, class_bit), 0, cv2.CMP_NE)
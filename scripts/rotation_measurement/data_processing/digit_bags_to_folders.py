@@ -1,7 +1,7 @@
 import rospy
 import rosbag
 import glob
-from grasp_executor.srv import AngleTrack
+from grasp_executor.srv import AngleTrackBatch
 from std_srvs.srv import Empty
 import os
 import pandas as pd
@@ -9,29 +9,44 @@ import itertools
 from cv_bridge import CvBridge, CvBridgeError
 import copy
 import cv2
+from image_codec import image_from_msg, image_msg, is_compressed
 
 FILE_DIR = '../data_collection/'
 FOLDER_NAME = 'digitdata'
 BAG_DIR = 'recorded_data_bags/'
 OUTPUT_DIR = 'digit_data_unpacked/'
+# Frames per track_angle_batch request, keeps each request to a few tens of MB of raw images
+ANGLE_BATCH = 64
 
 def digit_data_to_folder(folder, bridge, time_data, image_data, digit_data_0, digit_data_1, track_angle_srv):
     df = pd.DataFrame()
     df['true_angle'] = None
     df['timestep'] = None
 
-    for i, (time, im, digit_0, digit_1) in enumerate(itertools.izip(time_data, image_data, digit_data_0, digit_data_1)):
+    # A batch of frames per request instead of a service call per frame, tracking carries over between requests.
+    # The service takes raw images, compressed frames are decoded a batch at a time.
+    angles = []
+    for start in range(0, len(image_data), ANGLE_BATCH):
+        batch = [image_msg(im, bridge) for im in image_data[start:start + ANGLE_BATCH]]
+        angles.extend(track_angle_srv(batch, False).angles)
+    lost = sum(1 for angle in angles if angle != angle)
+    if lost:
+        print('WARNING: ' + folder + ' had ' + str(lost) + '/' + str(len(angles)) + ' frames without both blobs, their true_angle is nan')
+
+    for i, (time, angle, digit_0, digit_1) in enumerate(itertools.izip(time_data, angles, digit_data_0, digit_data_1)):
         new_row = pd.Series(dtype='int64')
-        response = track_angle_srv(im)
-        new_row['true_angle'] = response.angle
+        new_row['true_angle'] = angle
         new_row['timestep'] = time.to_nsec()
         df = df.append(copy.deepcopy(new_row), ignore_index=True)
 
-        dig_im_0 = bridge.imgmsg_to_cv2(digit_0, desired_encoding='8UC3')
-        dig_im_1 = bridge.imgmsg_to_cv2(digit_1, desired_encoding='8UC3')
-
-        cv2.imwrite(folder+"/"+str(i)+"_digit_0.jpeg", dig_im_0)
-        cv2.imwrite(folder+"/"+str(i)+"_digit_1.jpeg", dig_im_1)
+        for name, digit in (("_digit_0.jpeg", digit_0), ("_digit_1.jpeg", digit_1)):
+            path = folder+"/"+str(i)+name
+            if is_compressed(digit) and "jpeg" in digit.format:
+                # Already a JPEG, write it out as recorded instead of decoding and encoding again
+                with open(path, 'wb') as f:
+                    f.write(digit.data)
+            else:
+                cv2.imwrite(path, image_from_msg(digit, bridge))
 
     df.to_csv(folder+"/"+"ground_truth.csv", index=False)
 
@@ -72,9 +87,9 @@ if __name__ == "__main__":
         os.makedirs(FILE_DIR + OUTPUT_DIR)
         print("The new directory is created!")
 
-    rospy.wait_for_service('track_angle')
+    rospy.wait_for_service('track_angle_batch')
     try:
-        track_angle_srv = rospy.ServiceProxy('track_angle', AngleTrack)
+        track_angle_srv = rospy.ServiceProxy('track_angle_batch', AngleTrackBatch)
         rospy.loginfo("Angle tracking service available!")
     except rospy.ServiceException as e:
         print("Service call failed: %s"%e)
@@ -0,0 +1,64 @@
+import cv2
+import numpy as np
+import rospy
+from cv_bridge import CvBridge
+from sensor_msgs.msg import CompressedImage
+
+# Formats the data baggers can record camera and Digit frames in. raw is sensor_msgs/Image as before, the others
+# are sensor_msgs/CompressedImage.
+IMAGE_FORMATS = ("raw", "jpeg", "png")
+# High enough that the blob edges the angle detector finds don't move, use png where that matters
+JPEG_QUALITY = 95
+# PNG is lossless at every level, higher levels only trade encode time for a slightly smaller file
+PNG_COMPRESSION = 1
+
+
+class ImageEncoder:
+    # Turns BGR frames into bag messages in the chosen format. Safe to share between capture threads, cv2.imencode
+    # lets go of the GIL so frames from different sensors encode in parallel.
+    def __init__(self, image_format="raw", quality=JPEG_QUALITY, bridge=None):
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError("Unknown image format %s, expected one of %s" % (image_format, ", ".join(IMAGE_FORMATS)))
+        self.format = image_format
+        self.bridge = bridge if bridge is not None else CvBridge()
+        if image_format == "jpeg":
+            self.extension, self.params = ".jpg", [cv2.IMWRITE_JPEG_QUALITY, quality]
+        elif image_format == "png":
+            self.extension, self.params = ".png", [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION]
+
+    def encode(self, frame, stamp=None):
+        # stamp (s) goes in the message header when given
+        if self.format == "raw":
+            msg = self.bridge.cv2_to_imgmsg(frame)
+        else:
+            ok, data = cv2.imencode(self.extension, frame, self.params)
+            if not ok:
+                raise ValueError("Could not encode %s frame of shape %s" % (self.format, frame.shape))
+            msg = CompressedImage()
+            # Same format string as image_transport's compressed plugin, so rqt and rosbag tools can show them
+            msg.format = "bgr8; %s compressed bgr8" % self.format
+            msg.data = data.tobytes()
+        if stamp is not None:
+            msg.header.stamp = rospy.Time.from_sec(stamp)
+        return msg
+
+
+def is_compressed(msg):
+    # CompressedImage has a format where Image has an encoding
+    return hasattr(msg, "format")
+
+
+def image_msg(msg, bridge):
+    # sensor_msgs/Image of an image message in any of the recorded formats, header kept
+    if not is_compressed(msg):
+        return msg
+    raw = bridge.cv2_to_imgmsg(image_from_msg(msg, bridge))
+    raw.header = msg.header
+    return raw
+
+
+def image_from_msg(msg, bridge):
+    # BGR frame from an image message in any of the recorded formats
+    if is_compressed(msg):
+        return cv2.imdecode(np.frombuffer(msg.data, np.uint8), cv2.IMREAD_COLOR)
+    return bridge.imgmsg_to_cv2(msg, desired_encoding='8UC3')
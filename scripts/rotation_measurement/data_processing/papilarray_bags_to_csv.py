@@ -4,10 +4,12 @@ import rosbag, copy
 import glob
 import itertools
 import pandas as pd
-from grasp_executor.srv import AngleTrack
-from std_srvs.srv import Empty
+import numpy as np
 import os
 import pdb
+from cv_bridge import CvBridge
+from blob_detector import AngleDetector
+from image_codec import image_from_msg
 
 from grasp_executor.msg import DataCollectState
 
@@ -41,20 +43,25 @@ def init_df(df):
     
     return df
 
-def tactile_data_to_df(df, time_data, image_data, tactile_data_0, tactile_data_1, track_angle_srv, current_bag): 
+def tactile_data_to_df(df, time_data, image_data, tactile_data_0, tactile_data_1, angle_detector, bridge, current_bag): 
     cols_sensor = ['gfX', 'gfY', 'gfZ', 'gtX', 'gtY', 'gtZ', 'friction_est', 'target_grip_force']
     cols_pillar = ['dX', 'dY', 'dZ', 'fX', 'fY', 'fZ', 'in_contact']
-    largeChange = False
 
-    for time, im, tac_0, tac_1 in zip(time_data, image_data, tactile_data_0, tactile_data_1):
+    # Angles for the whole trial in one call, frames may be raw or compressed
+    frames = np.stack([image_from_msg(im, bridge) for im in image_data])
+    stamps = np.array([time.to_sec() for time in time_data])
+    angles, large_changes = angle_detector.track_batch(frames, stamps)
+    largeChange = bool(large_changes.any())
+    print(current_bag)
+    lost = np.count_nonzero(np.isnan(angles))
+    if lost:
+        print('WARNING: bag ' + current_bag + ' had ' + str(lost) + '/' + str(len(angles)) + ' frames without both blobs, their true_angle is nan')
+
+    for time, angle, tac_0, tac_1 in zip(time_data, angles, tactile_data_0, tactile_data_1):
         new_row = pd.Series(dtype='int64')
-        # print(type(im))
-        print(current_bag)
-        response = track_angle_srv(im) #TODO: Call the blob_detector service here to get the angle
-        new_row['true_angle'] = response.angle
-        largeChange = largeChange or response.largeChange
+        new_row['true_angle'] = angle
         new_row['timestep'] = time.to_nsec()
-        print(response.angle)
+        print(angle)
 
         for i in range(2):
             tac = tac_0 if i==0 else tac_1
@@ -75,7 +82,7 @@ def tactile_data_to_df(df, time_data, image_data, tactile_data_0, tactile_data_1
 
     return df, largeChange
 
-def main(track_angle_srv, reset_angle_srv):
+def main(angle_detector, bridge):
     num_df = len(glob.glob(FILE_DIR+OUTPUT_DIR+'*.csv'))
 
     bag_list = glob.glob(FILE_DIR+BAG_DIR+'*.bag')
@@ -119,7 +126,7 @@ def main(track_angle_srv, reset_angle_srv):
         # pdb.set_trace()
 
         if len(time_data) == len(image_data) == len(tactile_data_0) == len(tactile_data_1):
-            df, largeChange = tactile_data_to_df(df, time_data, image_data, tactile_data_0, tactile_data_1, track_angle_srv, current_bag)
+            df, largeChange = tactile_data_to_df(df, time_data, image_data, tactile_data_0, tactile_data_1, angle_detector, bridge, current_bag)
 
             #Naming convention is: <name>_<number of df>_<twist>_<gripperTwist>_<eeGroundRot>_<eeAirRot>_<gripperWidth>_<largeChange>.csv
             data = [FILE_DIR,OUTPUT_DIR,CSV_NAME,'_',num_df,'_',meta.gripperTwist,'_',meta.eeGroundRot,'_',meta.eeAirRot,'_',meta.gripperWidth,'_', largeChange, '.csv']
@@ -128,7 +135,7 @@ def main(track_angle_srv, reset_angle_srv):
         else:
             print('ERROR: bag ' + bag_dir +' had mismatched data!')
 
-        reset_angle_srv()
+        angle_detector.reset_tracking()
         
 if __name__ == "__main__":
     if not os.path.exists(FILE_DIR + OUTPUT_DIR):
@@ -136,19 +143,7 @@ if __name__ == "__main__":
         os.makedirs(FILE_DIR + OUTPUT_DIR)
         print("The new directory is created!")
 
-    rospy.wait_for_service('track_angle')
-    try:
-        track_angle_srv = rospy.ServiceProxy('track_angle', AngleTrack)
-        rospy.loginfo("Angle tracking service available!")
-    except rospy.ServiceException as e:
-        print("Service call failed: %s"%e)
-
-    rospy.wait_for_service('reset_angle_tracking')
-    try:
-        reset_angle_srv = rospy.ServiceProxy('reset_angle_tracking', Empty)
-        rospy.loginfo("Reset service available!")
-    except rospy.ServiceException as e:
-        print("Service call failed: %s"%e)
-    
+    # Angles are computed in process, no angle tracking service needed
+    angle_detector = AngleDetector(writeImages=False, showImages=False, cv2Image=True, recordVideo=False, useLUT=True)
 
-    main(track_angle_srv, reset_angle_srv)
\ No newline at end of file
+    main(angle_detector, CvBridge())
\ No newline at end of file
@@ -4,7 +4,7 @@ from blob_detector import AngleDetector
 l = glob.glob("./wrote_ims/img_temp_*")
 l.sort(key=lambda x : int(x.split("_")[3]))
 
-AD = AngleDetector(cv2Image=True, writeImages=False)
+AD = AngleDetector(cv2Image=True, writeImages=False, showImages=True, recordVideo=True)
 with open("output.csv", "w") as angle_file:
     for image in l:
         i = cv2.imread(image)
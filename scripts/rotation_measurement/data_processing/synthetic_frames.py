@@ -0,0 +1,63 @@
+import numpy as np
+import cv2
+
+try:
+    from angle_filter import wrap_angle
+except ImportError:
+    from rotation_measurement.data_processing.angle_filter import wrap_angle
+
+FRAME_SIZE = 300
+BACKGROUND = (190, 190, 190)
+# Blob and tape colours, BGR. The tape is also inside the red HSV range, so it has to be cut out by the detector.
+BLOB_COLOUR = (0, 0, 200)
+TAPE_COLOUR = (25, 40, 160)
+
+BLOB_RADIUS = 8
+BLOB_DISTANCE = 60  # px from the centre of rotation
+TAPE_RECT = ((90, 262), (210, 270))  # fixed strip across the bottom, like the tape on the gripper
+
+
+def render_frame(angle, rng=None, noise=0.0, blur=0, gain=1.0, gradient=0.0, scale=1):
+    # 300x300 (times scale) BGR frame with the two blobs at angle (deg, AngleDetector convention: counter clockwise
+    # on screen is positive) and the orange tape.
+    # noise is the std of added pixel noise, blur an odd Gaussian kernel size (0 for none),
+    # gain scales the brightness and gradient adds a left to right brightness ramp of that fraction.
+    size = FRAME_SIZE * scale
+    frame = np.empty((size, size, 3), np.uint8)
+    frame[:] = BACKGROUND
+    (x0, y0), (x1, y1) = TAPE_RECT
+    cv2.rectangle(frame, (x0 * scale, y0 * scale), (x1 * scale, y1 * scale), TAPE_COLOUR, -1)
+
+    center = np.array([size / 2.0, size / 2.0])
+    direction = np.array([np.cos(np.deg2rad(angle)), -np.sin(np.deg2rad(angle))])
+    for side in (-1, 1):
+        x, y = center + side * BLOB_DISTANCE * scale * direction
+        cv2.circle(frame, (int(round(x)), int(round(y))), BLOB_RADIUS * scale, BLOB_COLOUR, -1)
+
+    if blur:
+        frame = cv2.GaussianBlur(frame, (blur, blur), 0)
+    if gain != 1.0 or gradient:
+        ramp = gain * (1 + gradient * np.linspace(-0.5, 0.5, size))
+        frame = np.clip(frame * ramp[None, :, None], 0, 255).astype(np.uint8)
+    if noise:
+        rng = np.random.default_rng() if rng is None else rng
+        frame = np.clip(frame + rng.normal(0, noise, frame.shape), 0, 255).astype(np.uint8)
+    return frame
+
+
+def rotation_sequence(turns=2, velocity=90.0, start=-80.0, fps=60, noise=3.0, blur=3,
+                      gain_range=(0.85, 1.15), gradient=0.2, scale=1, seed=0):
+    # Frames of the blobs turning at velocity deg/s from start for the given number of full turns,
+    # so the tracker goes through every Quadrant transition. Lighting changes slowly over the sequence.
+    # Returns frames (T x 300 x 300 x 3, times scale), true angles wrapped to [-180, 180) and capture stamps in s.
+    rng = np.random.default_rng(seed)
+    num_frames = int(round(turns * 360.0 / abs(velocity) * fps))
+    stamps = np.arange(num_frames) / float(fps)
+    angles = start + velocity * stamps
+    gains = np.interp(np.sin(np.linspace(0, 2 * np.pi, num_frames)), [-1, 1], gain_range)
+
+    size = FRAME_SIZE * scale
+    frames = np.empty((num_frames, size, size, 3), np.uint8)
+    for i in range(num_frames):
+        frames[i] = render_frame(angles[i], rng, noise, blur, gains[i], gradient, scale)
+    return frames, wrap_angle(angles), stamps
@@ -0,0 +1,99 @@
+import atexit
+import threading
+import cv2
+
+try:
+    from queue import Queue, Full, Empty
+except ImportError:
+    from Queue import Queue, Full, Empty
+
+
+class DropPolicy:
+    DROP_NEWEST = "drop_newest"  # discard the incoming frame when the queue is full
+    DROP_OLDEST = "drop_oldest"  # discard the oldest queued frame to make room
+    BLOCK = "block"  # wait for the writer (old synchronous behaviour)
+
+
+class VideoRecorder:
+    # Writes frames to a video file from a background thread.
+    # write() and rollover() never wait on the encoder (unless the policy is BLOCK); frames that don't
+    # fit in the bounded queue are dropped and counted in dropped_frames.
+    # size is (width, height) of the video, None takes it from the first frame of each file.
+    def __init__(self, filename, fps=5, size=None, fourcc="MJPG", max_queue=32, drop_policy=DropPolicy.DROP_OLDEST):
+        self.fps = fps
+        self.size = size
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        self.drop_policy = drop_policy
+        self.queue = Queue(maxsize=max_queue)
+
+        self.dropped_frames = 0
+        self.written_frames = 0
+
+        # Every frame is tagged with the file generation it belongs to, rollover just starts a new one
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.filenames = {0: filename}
+
+        self.closed = False
+        self.thread = threading.Thread(target=self.write_loop)
+        self.thread.daemon = True
+        self.thread.start()
+        # Finish the file even if the owner never calls close()
+        atexit.register(self.close)
+
+    def write(self, frame):
+        item = (self.generation, frame)
+        if self.drop_policy == DropPolicy.BLOCK:
+            self.queue.put(item)
+            return
+        try:
+            self.queue.put_nowait(item)
+        except Full:
+            if self.drop_policy == DropPolicy.DROP_OLDEST:
+                try:
+                    self.queue.get_nowait()
+                except Empty:
+                    pass
+                try:
+                    self.queue.put_nowait(item)
+                except Full:
+                    pass
+            self.dropped_frames += 1
+
+    def rollover(self, filename):
+        # Frames written after this go to filename, the writer closes the old file when it gets there
+        with self.lock:
+            self.generation += 1
+            self.filenames[self.generation] = filename
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+
+    def write_loop(self):
+        writer = None
+        generation = -1
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            frame_generation, frame = item
+            if frame_generation != generation:
+                if writer is not None:
+                    writer.release()
+                with self.lock:
+                    filename = self.filenames.pop(frame_generation)
+                    # Files that never got a frame are skipped
+                    for g in [g for g in self.filenames if g < frame_generation]:
+                        del self.filenames[g]
+                size = self.size or (frame.shape[1], frame.shape[0])
+                writer = cv2.VideoWriter(filename, self.fourcc, self.fps, size)
+                generation = frame_generation
+            writer.write(frame)
+            self.written_frames += 1
+
+        if writer is not None:
+            writer.release()
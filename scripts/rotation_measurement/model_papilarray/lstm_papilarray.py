@@ -17,7 +17,10 @@ import argparse
 import sys
 import yaml
 from pathlib import Path
-from arg_set import parse_arguments
+try:
+    from arg_set import parse_arguments
+except ImportError:
+    from rotation_measurement.model_papilarray.arg_set import parse_arguments
 from enum import Enum
 import random
 
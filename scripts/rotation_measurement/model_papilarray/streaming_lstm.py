@@ -0,0 +1,94 @@
+import numpy as np
+import torch
+
+try:
+    from lstm_papilarray import RegressionLSTM
+except ImportError:
+    from rotation_measurement.model_papilarray.lstm_papilarray import RegressionLSTM
+from rotation_measurement.data_processing.angle_filter import AngleKalman
+
+# Features per time step in the column order papilarray_bags_to_csv.py writes (and the model trained on):
+# per sensor the global values, then the 9 pillars
+COLS_SENSOR = ["gfX", "gfY", "gfZ", "gtX", "gtY", "gtZ", "friction_est", "target_grip_force"]
+COLS_PILLAR = ["dX", "dY", "dZ", "fX", "fY", "fZ", "in_contact"]
+NUM_PILLARS = 9
+NUM_FEATURES = 2 * (len(COLS_SENSOR) + NUM_PILLARS * len(COLS_PILLAR))
+
+# base_params.yaml
+HIDDEN_SIZE = 500
+NUM_LAYERS = 3
+LABEL_SCALE = 90
+
+# The LSTM is a few degrees off where the blob detector is a fraction of one, deg^2
+MEASUREMENT_NOISE = 4.0
+
+
+class StreamingAngleEstimator:
+    # RegressionLSTM (un-normalised features, as trained from base_params.yaml) run one papillarray sample at a time.
+    # The LSTM state is carried between calls in preallocated tensors, so each sample costs one LSTM step instead of
+    # rerunning the whole sequence, and gives the same outputs as the model over the sequence since reset().
+    # The model estimates rotation since the start of the sequence, angles are start_angle plus that, deg.
+    # The velocity comes from an AngleKalman over the estimates, same interface as AngleDetector.
+    def __init__(self, model_path, hidden_size=HIDDEN_SIZE, num_layers=NUM_LAYERS, label_scale=LABEL_SCALE,
+                 start_angle=0.0, device="cpu"):
+        self.device = torch.device(device)
+        self.model = RegressionLSTM(self.device, NUM_FEATURES, hidden_size, num_layers, dropout=0.0)
+        self.model.load_state_dict(torch.load(model_path, map_location=self.device))
+        self.model.to(self.device).eval()
+        self.label_scale = label_scale
+        self.start_angle = start_angle
+
+        # One time step of one sequence, filled in place from the messages
+        self.features = np.zeros((1, 1, NUM_FEATURES), np.float32)
+        self.features_in = torch.zeros((1, 1, NUM_FEATURES), device=self.device)
+        self.h = torch.zeros((num_layers, 1, hidden_size), device=self.device)
+        self.c = torch.zeros((num_layers, 1, hidden_size), device=self.device)
+
+        self.kalman = AngleKalman(measurement_noise=MEASUREMENT_NOISE)
+        self.reset()
+
+    def reset(self, start_angle=None):
+        # Start of a new sequence (a new grasp)
+        if start_angle is not None:
+            self.start_angle = start_angle
+        self.h.zero_()
+        self.c.zero_()
+        self.kalman.reset()
+        self.angle = None
+        self.num_samples = 0
+
+    def fill_features(self, sensor_0, sensor_1):
+        row = self.features[0, 0]
+        i = 0
+        for sensor in (sensor_0, sensor_1):
+            for attr in COLS_SENSOR:
+                row[i] = getattr(sensor, attr)
+                i += 1
+            for j in range(NUM_PILLARS):
+                pillar = sensor.pillars[j]
+                for attr in COLS_PILLAR:
+                    row[i] = getattr(pillar, attr)
+                    i += 1
+
+    def update(self, sensor_0, sensor_1, stamp):
+        # One SensorState from each sensor taken at stamp (s), returns the estimated angle
+        self.fill_features(sensor_0, sensor_1)
+        self.features_in.copy_(torch.from_numpy(self.features))
+        with torch.no_grad():
+            out, (h_n, c_n) = self.model.lstm(self.features_in, (self.h, self.c))
+            self.h.copy_(h_n)
+            self.c.copy_(c_n)
+            rotation = self.model.output_linear_final(self.model.output_linear(out)).item()
+
+        self.angle = self.start_angle + rotation * self.label_scale
+        self.kalman.update(self.angle, stamp)
+        self.num_samples += 1
+        return self.angle
+
+    def getAngle(self):
+        if self.kalman.initialised:
+            return self.kalman.angle
+        return self.angle
+
+    def getAngularVelocity(self):
+        return self.kalman.velocity
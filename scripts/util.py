@@ -1,8 +1,21 @@
 import numpy as np
 import moveit_commander
-from moveit_msgs.msg import DisplayTrajectory
+from moveit_msgs.msg import DisplayTrajectory, RobotState
 import rospy
+import os
 
+# On-disk caches shared by the grasping demos
+CACHE_DIR = os.path.expanduser('~/.ros/grasp_executor')
+
+# (velocity, acceleration) scaling for each kind of move, fast when empty handed, gentle near or with an object.
+# Full scaling is only for open-space transits, near_box is for empty handed moves that end next to the box.
+MOTION_PROFILES = {
+    'empty': (1.0, 1.0),
+    'near_box': (0.5, 0.5),
+    'approach': (0.3, 0.3),
+    'carrying': (0.4, 0.3),
+}
+RETIME_ALGORITHM = "time_optimal_trajectory_generation"
 
 def dist_to_guess(p_base, guess):
     return np.sqrt((p_base.x - guess[0])**2 + (p_base.y - guess[1])**2 + (p_base.z - guess[2])**2)
@@ -10,7 +23,13 @@ def dist_to_guess(p_base, guess):
 def vector3ToNumpy(v):
     return np.array([v.x, v.y, v.z])
 
-def move_ur5(move_group, robot, disp_traj_pub, input, plan=None, no_confirm=False):
+def retime_plan(move_group, robot, plan, profile):
+    # Re-parameterise a plan (fresh or cached) in time with the profile's scaling
+    velocity, acceleration = MOTION_PROFILES[profile]
+    return move_group.retime_trajectory(robot.get_current_state(), plan, velocity, acceleration,
+                                        algorithm=RETIME_ALGORITHM)
+
+def move_ur5(move_group, robot, disp_traj_pub, input, plan=None, no_confirm=False, profile=None):
     if type(input) == list:
         move_group.set_joint_value_target(input)
     else:
@@ -19,6 +38,9 @@ def move_ur5(move_group, robot, disp_traj_pub, input, plan=None, no_confirm=Fals
     if not plan:
         plan = move_group.plan()
 
+    if profile is not None and plan.joint_trajectory.points:
+        plan = retime_plan(move_group, robot, plan, profile)
+
     if no_confirm or check_valid_plan(disp_traj_pub, robot, plan):
         move_group.execute(plan, wait=True)
     else: 
@@ -27,6 +49,54 @@ def move_ur5(move_group, robot, disp_traj_pub, input, plan=None, no_confirm=Fals
     move_group.stop()
     move_group.clear_pose_targets()
 
+def joint_robot_state(joint_names, positions):
+    robot_state = RobotState()
+    robot_state.joint_state.name = list(joint_names)
+    robot_state.joint_state.position = list(positions)
+    return robot_state
+
+def plan_ur5_through(move_group, robot, joint_waypoints, profile=None):
+    # Plans each leg from the end of the previous one and joins them into a single trajectory.
+    # With a profile the joined path is retimed with TOTG, which blends through the intermediate waypoints instead of
+    # stopping at them. Without one each leg keeps the planner's timing and the robot stops at every waypoint.
+    plan = None
+    for joints in joint_waypoints:
+        if plan is not None:
+            end = plan.joint_trajectory
+            move_group.set_start_state(joint_robot_state(end.joint_names, end.points[-1].positions))
+        move_group.set_joint_value_target(joints)
+        leg = move_group.plan()
+        move_group.clear_pose_targets()
+        if not leg.joint_trajectory.points:
+            plan = None
+            break
+        if plan is None:
+            plan = leg
+        else:
+            # First point of a leg is the last point of the previous one, its times start again from zero
+            leg_start = plan.joint_trajectory.points[-1].time_from_start
+            for point in leg.joint_trajectory.points[1:]:
+                point.time_from_start += leg_start
+                plan.joint_trajectory.points.append(point)
+
+    move_group.set_start_state_to_current_state()
+    if plan is None or profile is None:
+        return plan
+    return retime_plan(move_group, robot, plan, profile)
+
+def move_ur5_through(move_group, robot, disp_traj_pub, joint_waypoints, no_confirm=False, profile=None):
+    plan = plan_ur5_through(move_group, robot, joint_waypoints, profile)
+
+    if plan is None:
+        print("Plan is invalid!")
+    elif no_confirm or check_valid_plan(disp_traj_pub, robot, plan):
+        move_group.execute(plan, wait=True)
+    else:
+        print("Plan is invalid!")
+
+    move_group.stop()
+    move_group.clear_pose_targets()
+
 def show_motion(disp_traj_pub, robot, plan):
     display_trajectory = DisplayTrajectory()
     display_trajectory.trajectory_start = robot.get_current_state()